@@ -0,0 +1,304 @@
+"""
+Dataset storage for momentum twistor expressions.
+Module maps prefix tokens to integer ids and stores pre-tokenized corpora in
+memory-mapped files that PyTorch datasets read without parsing or unpickling.
+
+Corpus file layout (little-endian):
+    header  -- magic (8 bytes), token dtype string (8 bytes),
+               sequence count (uint64), total token count (uint64)
+    tokens  -- every sequence's token ids back to back
+    offsets -- count + 1 int64 positions of each sequence in tokens
+"""
+import itertools
+import json
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import torch
+from torch.nn.utils.rnn import pad_sequence
+from torch.utils.data import Dataset, Sampler
+
+from src.utils.parser import BRACKET_TYPES, OPERATORS, ExpressionNode
+
+PAD, BOS, EOS, UNK = 0, 1, 2, 3
+SPECIAL_TOKENS = ('<pad>', '<bos>', '<eos>', '<unk>')
+
+class Vocabulary:
+    """
+    Bidirectional mapping between prefix notation tokens and integer ids.
+    """
+    def __init__(self, tokens: Iterable[str]):
+        self.tokens: List[str] = list(SPECIAL_TOKENS)
+        self.ids: Dict[str, int] = {token: i for i, token in enumerate(self.tokens)}
+        for token in tokens:
+            if token not in self.ids:
+                self.ids[token] = len(self.tokens)
+                self.tokens.append(token)
+
+    @classmethod
+    def for_points(cls, n: int, max_integer: int = 10) -> 'Vocabulary':
+        """
+        Vocabulary covering every n-point prefix token: operators, integers
+        in [-max_integer, max_integer], twistors, dual twistors, the infinity
+        twistor and every bracket of four distinct indices.
+        """
+        tokens = list(OPERATORS)
+        tokens += [str(value) for value in range(-max_integer, max_integer + 1)]
+        tokens += [f"Z{i}" for i in range(1, n + 1)]
+        tokens += [f"W{i}" for i in range(1, n + 1)]
+        tokens.append("I")
+        for bracket_type in BRACKET_TYPES:
+            for indices in itertools.permutations(range(1, n + 1), 4):
+                tokens.append(bracket_type + ''.join(map(str, indices)))
+        return cls(tokens)
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def encode(self, tokens: Iterable[str]) -> List[int]:
+        """
+        Map tokens to ids, using the unknown id for tokens not in the vocabulary.
+        """
+        ids = self.ids
+        return [ids.get(token, UNK) for token in tokens]
+
+    def encode_expression(self, node: ExpressionNode, add_markers: bool = True) -> List[int]:
+        """
+        Stream an expression's prefix tokens straight into ids.
+        """
+        ids = self.encode(node.iter_prefix())
+        return [BOS] + ids + [EOS] if add_markers else ids
+
+    def decode(self, ids: Iterable[int]) -> List[str]:
+        """
+        Map ids back to tokens, dropping padding and sequence markers.
+        """
+        return [self.tokens[i] for i in ids if i not in (PAD, BOS, EOS)]
+
+    def save(self, path: str):
+        """
+        Write the vocabulary as a JSON list of tokens.
+        """
+        with open(path, 'w') as handle:
+            json.dump(self.tokens[len(SPECIAL_TOKENS):], handle)
+
+    @classmethod
+    def load(cls, path: str) -> 'Vocabulary':
+        """
+        Read a vocabulary written by save.
+        """
+        with open(path) as handle:
+            return cls(json.load(handle))
+
+_MAGIC = b'MTCORP01'
+_HEADER = struct.Struct('<8s8sQQ')
+
+class CorpusWriter:
+    """
+    Streams token id sequences into a corpus file.
+    """
+    def __init__(self, path: str, dtype=np.uint16):
+        self.path = path
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.offsets = [0]
+        self._handle = open(path, 'wb')
+        self._handle.write(b'\0' * _HEADER.size)
+
+    def add(self, ids: Sequence[int]):
+        """
+        Append one sequence of token ids.
+        """
+        array = np.asarray(ids, dtype=self.dtype)
+        self._handle.write(array.tobytes())
+        self.offsets.append(self.offsets[-1] + len(array))
+
+    def close(self):
+        """
+        Write the offsets index and header, then close the file.
+        """
+        if self._handle.closed:
+            return
+        self._handle.write(np.asarray(self.offsets, dtype='<i8').tobytes())
+        self._handle.seek(0)
+        self._handle.write(_HEADER.pack(_MAGIC, self.dtype.str.encode().ljust(8, b'\0'),
+                                        len(self.offsets) - 1, self.offsets[-1]))
+        self._handle.close()
+
+    def __enter__(self) -> 'CorpusWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def write_corpus(path: str, sequences: Iterable[Sequence[int]], dtype=np.uint16) -> int:
+    """
+    Write token id sequences to a corpus file, returning how many were written.
+    """
+    with CorpusWriter(path, dtype) as writer:
+        for ids in sequences:
+            writer.add(ids)
+    return len(writer.offsets) - 1
+
+class ExpressionCorpus:
+    """
+    Read-only, memory-mapped view of a corpus file.
+
+    The mapping is opened lazily and dropped when pickled, so every
+    DataLoader worker maps the file itself and they share pages through the
+    OS cache instead of each holding a copy.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as handle:
+            magic, dtype, count, total = _HEADER.unpack(handle.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not an expression corpus file")
+        self.dtype = np.dtype(dtype.rstrip(b'\0').decode())
+        self.count = count
+        self.total = total
+        self._tokens: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+
+    def _open(self):
+        self._tokens = np.memmap(self.path, dtype=self.dtype, mode='r',
+                                 offset=_HEADER.size, shape=(self.total,))
+        self._offsets = np.memmap(self.path, dtype='<i8', mode='r',
+                                  offset=_HEADER.size + self.total * self.dtype.itemsize,
+                                  shape=(self.count + 1,))
+
+    @property
+    def offsets(self) -> np.ndarray:
+        if self._offsets is None:
+            self._open()
+        return self._offsets
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """
+        Number of tokens in every sequence.
+        """
+        return np.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        """
+        Token ids of one sequence, as a view into the mapped file.
+        """
+        if self._tokens is None:
+            self._open()
+        if not -self.count <= index < self.count:
+            raise IndexError(index)
+        index %= self.count
+        return self._tokens[self._offsets[index]:self._offsets[index + 1]]
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_tokens'] = None
+        state['_offsets'] = None
+        return state
+
+class ExpressionDataset(Dataset):
+    """
+    PyTorch dataset over a memory-mapped source corpus and, for training
+    pairs, a target corpus with the same number of sequences.
+    """
+    def __init__(self, source_path: str, target_path: Optional[str] = None):
+        self.source = ExpressionCorpus(source_path)
+        self.target = ExpressionCorpus(target_path) if target_path else None
+        if self.target is not None and len(self.target) != len(self.source):
+            raise ValueError("Source and target corpora differ in length")
+
+    def __len__(self) -> int:
+        return len(self.source)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """
+        Longest of the source and target lengths of every sample.
+        """
+        if self.target is None:
+            return self.source.lengths
+        return np.maximum(self.source.lengths, self.target.lengths)
+
+    def __getitem__(self, index: int):
+        source = torch.from_numpy(self.source[index].astype(np.int64))
+        if self.target is None:
+            return source
+        return source, torch.from_numpy(self.target[index].astype(np.int64))
+
+class TokenBudgetBatchSampler(Sampler):
+    """
+    Batch sampler that groups sequences of similar length.
+
+    Indices are shuffled, split into pools of pool_size samples and sorted by
+    length within each pool; batches are then cut greedily so that the padded
+    size (batch size x longest sequence) stays within max_tokens. Batch order
+    is shuffled again, so batches of every length are mixed across an epoch.
+    A sequence longer than max_tokens gets a batch of its own.
+    """
+    def __init__(self, lengths: Sequence[int], max_tokens: int, shuffle: bool = True,
+                 pool_size: int = 4096, seed: int = 0):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.max_tokens = max_tokens
+        self.shuffle = shuffle
+        self.pool_size = pool_size
+        self.seed = seed
+        self.epoch = 0
+        self._batches: Optional[List[List[int]]] = None
+
+    def set_epoch(self, epoch: int):
+        """
+        Select the epoch whose shuffle order is used next.
+        """
+        if epoch != self.epoch:
+            self.epoch = epoch
+            self._batches = None
+
+    def _build(self) -> List[List[int]]:
+        rng = np.random.default_rng([self.seed, self.epoch])
+        if self.shuffle:
+            order = rng.permutation(len(self.lengths))
+        else:
+            order = np.arange(len(self.lengths))
+        batches = []
+        for start in range(0, len(order), self.pool_size):
+            pool = order[start:start + self.pool_size]
+            pool = pool[np.argsort(self.lengths[pool], kind='stable')]
+            batch: List[int] = []
+            longest = 0
+            for index, length in zip(pool.tolist(), self.lengths[pool].tolist()):
+                if batch and max(longest, length) * (len(batch) + 1) > self.max_tokens:
+                    batches.append(batch)
+                    batch = []
+                    longest = 0
+                batch.append(index)
+                longest = max(longest, length)
+            if batch:
+                batches.append(batch)
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        return batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        if self._batches is None:
+            self._batches = self._build()
+        return iter(self._batches)
+
+    def __len__(self) -> int:
+        if self._batches is None:
+            self._batches = self._build()
+        return len(self._batches)
+
+def pad_collate(batch):
+    """
+    Pad a list of id tensors, or of (source, target) pairs, into [batch, length]
+    tensors filled with the padding id.
+    """
+    if isinstance(batch[0], torch.Tensor):
+        return pad_sequence(batch, batch_first=True, padding_value=PAD)
+    sources, targets = zip(*batch)
+    return (pad_sequence(list(sources), batch_first=True, padding_value=PAD),
+            pad_sequence(list(targets), batch_first=True, padding_value=PAD))
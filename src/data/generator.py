@@ -0,0 +1,161 @@
+"""
+Generators for momentum twistor training data.
+Module produces random kinematic configurations in vectorized batches and
+random bracket expressions streamed to corpus files.
+"""
+import multiprocessing
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.data.dataset import CorpusWriter, Vocabulary
+from src.utils.exact import PRIMES
+from src.utils.parser import BracketNode, ExpressionNode, NumberNode, OperatorNode
+
+KINDS = ('real', 'complex', 'integer', 'modular')
+
+def kinematics_rng(seed: int, batch: int) -> np.random.Generator:
+    """
+    Counter-based generator for one batch.
+
+    The seed is the Philox key and the batch number sits in the top word of
+    the 256-bit counter, so each batch has its own stream that any worker can
+    regenerate without drawing the batches before it.
+    """
+    return np.random.Generator(np.random.Philox(key=seed, counter=[0, 0, 0, batch]))
+
+def random_twistors(points: int, n: int, kind: str = 'real', seed: int = 0, batch: int = 0,
+                    low: int = -100, high: int = 100, prime: int = PRIMES[0]) -> np.ndarray:
+    """
+    Random momentum twistors for n particles, shape [points, n, 4].
+
+    kind selects the entries: 'real' standard normal float64, 'complex'
+    standard complex normal complex128, 'integer' int64 in [low, high] and
+    'modular' int64 residues in [0, prime). The result depends only on
+    (seed, batch) and the arguments.
+    """
+    rng = kinematics_rng(seed, batch)
+    shape = (points, n, 4)
+    if kind == 'real':
+        return rng.standard_normal(shape)
+    if kind == 'complex':
+        values = rng.standard_normal((2,) + shape)
+        return (values[0] + 1j * values[1]) / np.sqrt(2)
+    if kind == 'integer':
+        return rng.integers(low, high, size=shape, endpoint=True, dtype=np.int64)
+    if kind == 'modular':
+        return rng.integers(0, prime, size=shape, dtype=np.int64)
+    raise ValueError(f"Unknown kinematics kind {kind!r}, expected one of {KINDS}")
+
+class ExpressionGenerator:
+    """
+    Random rational functions of four-brackets for n particles.
+
+    Each expression is a sum of terms, and each term is an integer
+    coefficient times a product of brackets over a product of brackets.
+    The number of terms, numerator factors and denominator factors are drawn
+    uniformly from the given inclusive ranges, and coefficients from
+    +-[1, max_coefficient]. A term without numerator brackets has the
+    constant 1 as its numerator. Brackets are written with sorted indices.
+    """
+    def __init__(self, n: int = 6, terms: Tuple[int, int] = (1, 4),
+                 numerator_factors: Tuple[int, int] = (1, 3),
+                 denominator_factors: Tuple[int, int] = (0, 3), max_coefficient: int = 5):
+        if n < 4:
+            raise ValueError("Four-brackets need at least four particles")
+        if n > 9:
+            raise ValueError("Prefix tokens such as angle1234 only support indices below 10")
+        self.n = n
+        self.terms = terms
+        self.numerator_factors = numerator_factors
+        self.denominator_factors = denominator_factors
+        self.max_coefficient = max_coefficient
+
+    def generate(self, count: int, rng: np.random.Generator) -> List[ExpressionNode]:
+        """
+        Draw count expressions. Sizes, coefficients and bracket indices for
+        the whole batch are drawn in a few vectorized calls.
+        """
+        term_counts = rng.integers(self.terms[0], self.terms[1], size=count, endpoint=True)
+        total_terms = int(term_counts.sum())
+        numerators = rng.integers(*self.numerator_factors, size=total_terms, endpoint=True)
+        denominators = rng.integers(*self.denominator_factors, size=total_terms, endpoint=True)
+        coefficients = rng.integers(1, self.max_coefficient, size=total_terms, endpoint=True)
+        coefficients *= rng.choice([-1, 1], size=total_terms)
+        total_brackets = int(numerators.sum() + denominators.sum())
+        indices = np.sort(rng.random((total_brackets, self.n)).argsort(axis=1)[:, :4] + 1, axis=1)
+        brackets = [BracketNode('angle', row) for row in indices.tolist()]
+
+        expressions = []
+        term = 0
+        bracket = 0
+        for term_count in term_counts.tolist():
+            terms = []
+            for _ in range(term_count):
+                numerator_count = int(numerators[term])
+                denominator_count = int(denominators[term])
+                factors = brackets[bracket:bracket + numerator_count]
+                bracket += numerator_count
+                coefficient = int(coefficients[term])
+                if coefficient != 1:
+                    factors.insert(0, NumberNode(coefficient))
+                node = _product(factors) if factors else NumberNode(1)
+                if denominator_count:
+                    node = OperatorNode('div', [node, _product(brackets[bracket:bracket + denominator_count])])
+                    bracket += denominator_count
+                terms.append(node)
+                term += 1
+            expressions.append(terms[0] if len(terms) == 1 else OperatorNode('add', terms))
+        return expressions
+
+def _product(factors: List[ExpressionNode]) -> ExpressionNode:
+    """
+    A single factor, or the mul node of several.
+    """
+    return factors[0] if len(factors) == 1 else OperatorNode('mul', factors)
+
+def _shard_rng(seed: int, shard: int) -> np.random.Generator:
+    """
+    Counter-based generator for one shard of generated expressions, on a
+    counter word disjoint from the kinematics batches.
+    """
+    return np.random.Generator(np.random.Philox(key=seed, counter=[0, 0, 1, shard]))
+
+def _write_shard(task: tuple) -> str:
+    """
+    Generate one shard of expressions and stream it to a corpus file.
+    """
+    path, generator, vocabulary, count, seed, shard, chunk_size = task
+    rng = _shard_rng(seed, shard)
+    with CorpusWriter(path) as writer:
+        for start in range(0, count, chunk_size):
+            for expression in generator.generate(min(chunk_size, count - start), rng):
+                writer.add(vocabulary.encode_expression(expression))
+    return path
+
+def generate_corpus(directory: str, count: int, generator: ExpressionGenerator,
+                    vocabulary: Optional[Vocabulary] = None, shards: int = 1,
+                    workers: Optional[int] = None, seed: int = 0,
+                    chunk_size: int = 10000) -> List[str]:
+    """
+    Generate count expressions as prefix token ids into shard corpus files.
+
+    Shards are generated in parallel over a process pool. Every shard draws
+    from its own counter-based stream keyed by (seed, shard), so for a given
+    seed, shard count and chunk_size the output is the same whatever the
+    number of workers. Each shard is generated and written chunk_size
+    expressions at a time. Returns the shard paths.
+    """
+    vocabulary = vocabulary or Vocabulary.for_points(generator.n, generator.max_coefficient)
+    os.makedirs(directory, exist_ok=True)
+    tasks = []
+    for shard in range(shards):
+        shard_count = count // shards + (shard < count % shards)
+        path = os.path.join(directory, f"shard-{shard:05d}.bin")
+        tasks.append((path, generator, vocabulary, shard_count, seed, shard, chunk_size))
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or shards <= 1:
+        return [_write_shard(task) for task in tasks]
+    with multiprocessing.Pool(min(workers, shards)) as pool:
+        return pool.map(_write_shard, tasks, chunksize=1)
@@ -0,0 +1,251 @@
+"""
+Scrambler for momentum twistor training data.
+Module rewrites simple bracket expressions into complicated equivalents by
+expanding products of brackets with random Plücker relations and permuting
+bracket indices, and pairs them up with their simple forms.
+"""
+import itertools
+import random
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.utils.identities import Key, Relation, bracket_id, identity_index, product_node
+from src.utils.parser import (
+    BracketNode,
+    DualTwistorNode,
+    ExpressionNode,
+    NumberNode,
+    OperatorNode,
+    TwistorNode,
+    iter_unique,
+    sort_indices,
+)
+
+Path = Tuple[int, ...]
+
+# Every reordering of four bracket positions with its sign.
+_PERMUTATIONS = tuple((order, sort_indices(order)[1]) for order in itertools.permutations(range(4)))
+
+def _python_random(rng: np.random.Generator) -> random.Random:
+    """
+    Python generator seeded from a NumPy generator; its scalar draws are far
+    cheaper than NumPy's for per-node decisions.
+    """
+    return random.Random(int(rng.integers(2 ** 63)))
+
+def _rebuild(root: ExpressionNode, leaf: Callable[[ExpressionNode], ExpressionNode]) -> ExpressionNode:
+    """
+    Copy the operator nodes of a tree with every leaf replaced by leaf(node),
+    without recursion. Shared subtrees stay shared.
+    """
+    built: Dict[int, ExpressionNode] = {}
+    for node in iter_unique(root):
+        if isinstance(node, OperatorNode):
+            built[id(node)] = OperatorNode(node.op_type, [built[id(operand)] for operand in node.operands])
+        else:
+            built[id(node)] = leaf(node)
+    return built[id(root)]
+
+def _replace(root: ExpressionNode, path: Path, replacement: ExpressionNode) -> ExpressionNode:
+    """
+    Copy of root with the node at the given operand path replaced.
+    """
+    chain = [root]
+    for position in path[:-1]:
+        chain.append(chain[-1].operands[position])
+    node = replacement
+    for parent, position in zip(reversed(chain), reversed(path)):
+        operands = list(parent.operands)
+        operands[position] = node
+        node = OperatorNode(parent.op_type, operands)
+    return node
+
+def _relabel_leaf(node: ExpressionNode, mapping: Dict[int, int]) -> ExpressionNode:
+    """
+    A leaf with its particle indices renamed.
+    """
+    if isinstance(node, BracketNode):
+        return BracketNode(node.bracket_type, [mapping.get(i, i) for i in node.indices])
+    if isinstance(node, TwistorNode):
+        return TwistorNode(mapping.get(node.index, node.index))
+    if isinstance(node, DualTwistorNode):
+        return DualTwistorNode(mapping.get(node.index, node.index))
+    return node
+
+def relabel(node: ExpressionNode, mapping: Dict[int, int]) -> ExpressionNode:
+    """
+    Rename the particle indices of every bracket and twistor in a tree;
+    indices missing from mapping are kept.
+    """
+    return _rebuild(node, lambda leaf: _relabel_leaf(leaf, mapping))
+
+def cyclic_mapping(n: int, shift: int) -> Dict[int, int]:
+    """
+    Relabeling i -> i + shift of n points, modulo n.
+    """
+    return {i: (i - 1 + shift) % n + 1 for i in range(1, n + 1)}
+
+class Scrambler:
+    """
+    Random rewriting of n-point four-bracket expressions into equivalents.
+
+    Each scramble applies a number of Plücker expansions drawn uniformly from
+    the inclusive range steps: a product <A><B> inside a mul node, where
+    <A><B> is a unit term of some relation, is replaced by minus the other
+    terms of that relation. Afterwards every bracket is, with probability
+    antisymmetry, written with permuted indices and the permutation sign.
+    Relations are looked up in the stored identity index for n, and the
+    expansions of each bracket pair are memoized. Public methods take a
+    NumPy generator and draw one seed from it per call.
+    """
+    def __init__(self, n: int, steps: Tuple[int, int] = (1, 3), antisymmetry: float = 0.3,
+                 cache_dir: Optional[str] = None):
+        self.n = n
+        self.steps = steps
+        self.antisymmetry = antisymmetry
+        self.index = identity_index(n, cache_dir)
+        self._expansions: Dict[Tuple[Key, Key], Tuple[Tuple[int, int], ...]] = {}
+        self._relations: Dict[int, Relation] = {}
+
+    def expansions(self, pair: Tuple[Key, Key]) -> Tuple[Tuple[int, int], ...]:
+        """
+        (relation id, term position) of every relation in which the product
+        of a sorted bracket pair is a term with coefficient +-1.
+        """
+        entries = self._expansions.get(pair)
+        if entries is None:
+            relation_ids = self.index.relations_containing(pair[0])
+            rows = np.asarray(self.index.terms[relation_ids])
+            found, positions = np.nonzero((np.abs(rows[:, :, 0]) == 1)
+                                          & (rows[:, :, 1] == bracket_id(pair[0]))
+                                          & (rows[:, :, 2] == bracket_id(pair[1])))
+            entries = tuple(zip(relation_ids[found].tolist(), positions.tolist()))
+            self._expansions[pair] = entries
+        return entries
+
+    def relation(self, relation_id: int) -> Relation:
+        """
+        Terms of a relation, decoded from the index once.
+        """
+        relation = self._relations.get(relation_id)
+        if relation is None:
+            relation = self._relations[relation_id] = self.index.relation(relation_id)
+        return relation
+
+    def _pairs(self, node: OperatorNode) -> List[Tuple[int, int, Tuple[Key, Key]]]:
+        """
+        Operand positions of bracket pairs in a mul node that some relation
+        can expand, with their sorted keys.
+        """
+        brackets = []
+        for position, operand in enumerate(node.operands):
+            if isinstance(operand, BracketNode) and operand.bracket_type == 'angle':
+                brackets.append((position, tuple(sorted(operand.indices))))
+        pairs = []
+        for i in range(len(brackets)):
+            for j in range(i + 1, len(brackets)):
+                (first, first_key), (second, second_key) = brackets[i], brackets[j]
+                if first_key > second_key:
+                    first, first_key, second, second_key = second, second_key, first, first_key
+                if self.expansions((first_key, second_key)):
+                    pairs.append((first, second, (first_key, second_key)))
+        return pairs
+
+    def _expand(self, root: ExpressionNode, rand: random.Random) -> Optional[ExpressionNode]:
+        """
+        Apply one random Plücker expansion, or return None if no product in
+        the tree can be expanded.
+        """
+        sites = []
+        stack: List[Tuple[ExpressionNode, Path]] = [(root, ())]
+        while stack:
+            node, path = stack.pop()
+            if isinstance(node, OperatorNode):
+                if node.op_type == 'mul':
+                    pairs = self._pairs(node)
+                    if pairs:
+                        sites.append((node, path, pairs))
+                for position, operand in enumerate(node.operands):
+                    stack.append((operand, path + (position,)))
+        if not sites:
+            return None
+        node, path, pairs = rand.choice(sites)
+        first, second, pair = rand.choice(pairs)
+        relation_id, position = rand.choice(self.expansions(pair))
+        relation = self.relation(relation_id)
+
+        # <A><B> = sign * <A sorted><B sorted> and c_k <A sorted><B sorted> = -sum of the other terms.
+        sign = sort_indices(node.operands[first].indices)[1] * sort_indices(node.operands[second].indices)[1]
+        scale = -sign * relation[position][0]
+        expansion = OperatorNode('add', [product_node(scale * coefficient, [left, right])
+                                         for k, (coefficient, left, right) in enumerate(relation)
+                                         if k != position])
+        operands = [operand for k, operand in enumerate(node.operands) if k != second]
+        operands[first - (second < first)] = expansion
+        replacement = operands[0] if len(operands) == 1 else OperatorNode('mul', operands)
+        return _replace(root, path, replacement)
+
+    def _permute(self, root: ExpressionNode, rand: random.Random,
+                 mapping: Optional[Dict[int, int]] = None) -> ExpressionNode:
+        """
+        Rewrite random four-brackets with permuted indices, multiplying by
+        the sign of the permutation where it is odd, and apply an optional
+        relabeling to every leaf in the same pass.
+        """
+        antisymmetry = self.antisymmetry
+        def leaf(node: ExpressionNode) -> ExpressionNode:
+            if mapping is not None:
+                node = _relabel_leaf(node, mapping)
+            if (not isinstance(node, BracketNode) or len(node.indices) != 4
+                    or rand.random() >= antisymmetry):
+                return node
+            order, sign = _PERMUTATIONS[rand.randrange(len(_PERMUTATIONS))]
+            indices = node.indices
+            permuted = BracketNode(node.bracket_type, [indices[i] for i in order])
+            return permuted if sign > 0 else OperatorNode('mul', [NumberNode(-1), permuted])
+        return _rebuild(root, leaf)
+
+    def _scramble(self, node: ExpressionNode, rand: random.Random,
+                  mapping: Optional[Dict[int, int]] = None) -> ExpressionNode:
+        for _ in range(rand.randint(*self.steps)):
+            expanded = self._expand(node, rand)
+            if expanded is None:
+                break
+            node = expanded
+        if self.antisymmetry or mapping is not None:
+            node = self._permute(node, rand, mapping)
+        return node
+
+    def scramble(self, node: ExpressionNode, rng: np.random.Generator) -> ExpressionNode:
+        """
+        A random equivalent of node.
+        """
+        return self._scramble(node, _python_random(rng))
+
+    def scramble_batch(self, nodes: Sequence[ExpressionNode],
+                       rng: np.random.Generator) -> List[ExpressionNode]:
+        """
+        Scramble every expression of a batch.
+        """
+        rand = _python_random(rng)
+        return [self._scramble(node, rand) for node in nodes]
+
+    def training_pairs(self, nodes: Sequence[ExpressionNode], rng: np.random.Generator,
+                       cyclic: bool = True) -> List[Tuple[ExpressionNode, ExpressionNode]]:
+        """
+        (scrambled, simple) pairs for a batch of simple expressions. With
+        cyclic set, both members of each pair are relabeled by the same
+        random cyclic shift of the n points.
+        """
+        rand = _python_random(rng)
+        mappings = [cyclic_mapping(self.n, shift) for shift in range(self.n)]
+        pairs = []
+        for node in nodes:
+            shift = rand.randrange(self.n) if cyclic else 0
+            if shift:
+                mapping = mappings[shift]
+                pairs.append((self._scramble(node, rand, mapping), relabel(node, mapping)))
+            else:
+                pairs.append((self._scramble(node, rand), node))
+        return pairs
@@ -0,0 +1,423 @@
+"""
+Numeric evaluation of momentum twistor expressions.
+Module evaluates expression trees over batches of kinematic points, where a
+batch of momentum twistors has shape [points, n, 4] and twistor index i
+(1-based) is Z[:, i - 1].
+"""
+import operator
+from fractions import Fraction
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.utils.exact import PRIMES, bareiss_det, det2_mod, det4_mod, inverse_mod, pow_mod
+
+from src.utils.parser import (
+    BracketNode,
+    ExpressionNode,
+    NumberNode,
+    OperatorNode,
+    iter_unique,
+    sort_indices,
+)
+
+def four_brackets(Z: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    Evaluate the four-brackets <i,j,k,l> = det(Z_i, Z_j, Z_k, Z_l).
+
+    indices has shape [brackets, 4]; the result has shape [points, brackets]
+    and is computed as one batched 4x4 determinant.
+    """
+    indices = np.asarray(indices, dtype=np.intp).reshape(-1, 4)
+    return np.linalg.det(Z[:, indices - 1])
+
+def two_brackets(Z: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    Evaluate the two-brackets <i,j> = <i,j,I> built from the first two
+    (lambda) components of each twistor.
+
+    indices has shape [brackets, 2]; the result has shape [points, brackets].
+    """
+    indices = np.asarray(indices, dtype=np.intp).reshape(-1, 2)
+    first = Z[:, indices[:, 0] - 1, :2]
+    second = Z[:, indices[:, 1] - 1, :2]
+    return first[..., 0] * second[..., 1] - first[..., 1] * second[..., 0]
+
+class BracketCache:
+    """
+    Bracket values for one batch of kinematic points.
+
+    Values are keyed by the sorted index tuple, so <2,1,3,4> and <1,2,3,4>
+    share one determinant and lookups apply the permutation sign. Missing
+    keys are computed together in one batched call. Reuse a cache to
+    evaluate many expressions over the same points.
+    """
+    def __init__(self, Z: np.ndarray):
+        self.Z = Z
+        self.dtype = np.result_type(Z.dtype, np.float64)
+        self._values: Dict[Tuple[int, ...], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def prefetch(self, keys: Iterable[Tuple[int, ...]]):
+        """
+        Compute every missing sorted index tuple in one batched call per width.
+        """
+        missing = {key for key in keys if key not in self._values}
+        for width, function in ((4, four_brackets), (2, two_brackets)):
+            batch = [key for key in missing if len(key) == width]
+            if batch:
+                table = function(self.Z, batch)
+                for column, key in enumerate(batch):
+                    self._values[key] = table[:, column]
+            missing.difference_update(batch)
+        if missing:
+            raise ValueError(f"Cannot evaluate bracket with indices {sorted(missing)[0]}")
+
+    def get(self, indices: Sequence[int]) -> np.ndarray:
+        """
+        Value of the angle bracket with the given indices, shape [points].
+        """
+        key, sign = sort_indices(indices)
+        if sign == 0:
+            if len(key) not in (2, 4):
+                raise ValueError(f"Cannot evaluate bracket with indices {key}")
+            return np.zeros(self.Z.shape[0], dtype=self.dtype)
+        if key not in self._values:
+            self.prefetch([key])
+        value = self._values[key]
+        return value if sign > 0 else -value
+
+def bracket_values(Z: np.ndarray, brackets: Sequence[BracketNode],
+                   cache: Optional[BracketCache] = None) -> np.ndarray:
+    """
+    Evaluate angle brackets of two or four indices, shape [points, brackets].
+    """
+    for bracket in brackets:
+        if bracket.bracket_type != 'angle' or len(bracket.indices) not in (2, 4):
+            raise ValueError(f"Cannot evaluate bracket {bracket.to_string()}")
+    cache = cache if cache is not None else BracketCache(Z)
+    cache.prefetch(sort_indices(bracket.indices)[0] for bracket in brackets)
+    values = np.empty((Z.shape[0], len(brackets)), dtype=cache.dtype)
+    for column, bracket in enumerate(brackets):
+        values[:, column] = cache.get(bracket.indices)
+    return values
+
+# Elementwise implementation of each instruction opcode.
+_FLOAT_OPS = {
+    'add': np.add,
+    'sub': np.subtract,
+    'mul': np.multiply,
+    'div': np.divide,
+    'pow': np.power,
+    'neg': np.negative,
+}
+_EXACT_OPS = {
+    'add': operator.add,
+    'sub': operator.sub,
+    'mul': operator.mul,
+    'div': operator.truediv,
+    'neg': operator.neg,
+}
+_COMMUTATIVE = ('add', 'mul')
+
+class CompiledExpression:
+    """
+    Straight-line program that evaluates one expression.
+
+    Registers hold constants, bracket columns or intermediate arrays. Each
+    instruction is (opcode, destination, first source, second source), with
+    the second source None for 'neg'. Each register is released after its
+    last use, so memory stays bounded by the live intermediates.
+    """
+    def __init__(self, keys: List[Tuple[int, ...]], loads: List[Tuple[int, int]],
+                 constants: Dict[int, float], instructions: List[tuple],
+                 n_registers: int, output: int):
+        self.keys = keys
+        self.loads = loads
+        self.constants = constants
+        self.instructions = instructions
+        self.n_registers = n_registers
+        self.output = output
+        last_use: Dict[int, int] = {}
+        for position, (_, _, first, second) in enumerate(instructions):
+            last_use[first] = position
+            if second is not None:
+                last_use[second] = position
+        self._frees: List[List[int]] = [[] for _ in instructions]
+        for register, position in last_use.items():
+            if register != output:
+                self._frees[position].append(register)
+
+    def __len__(self) -> int:
+        return len(self.instructions)
+
+    def _run(self, registers: list, ops: dict) -> np.ndarray:
+        frees = self._frees
+        for position, (opcode, destination, first, second) in enumerate(self.instructions):
+            if second is None:
+                registers[destination] = ops[opcode](registers[first])
+            else:
+                registers[destination] = ops[opcode](registers[first], registers[second])
+            for register in frees[position]:
+                registers[register] = None
+        return registers[self.output]
+
+    def evaluate(self, Z: np.ndarray, cache: Optional[BracketCache] = None) -> np.ndarray:
+        """
+        Evaluate at every kinematic point of Z, shape [points]. A cache, if
+        given, must belong to Z.
+        """
+        cache = cache if cache is not None else BracketCache(Z)
+        cache.prefetch(self.keys)
+        registers: list = [None] * self.n_registers
+        for register, value in self.constants.items():
+            registers[register] = np.float64(value)
+        for register, column in self.loads:
+            registers[register] = cache.get(self.keys[column])
+        result = self._run(registers, _FLOAT_OPS)
+        return np.broadcast_to(result, (Z.shape[0],)).astype(cache.dtype, copy=True)
+
+    def _integer_exponent(self, register: int) -> int:
+        """
+        Exponent of a pow instruction, which exact modes need as an integer constant.
+        """
+        value = self.constants.get(register)
+        if value is None or Fraction(value).denominator != 1:
+            raise ValueError("Exact evaluation needs constant integer exponents")
+        return int(value)
+
+    def evaluate_modular(self, Z: np.ndarray, primes: Sequence[int] = PRIMES) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluate exactly modulo each prime at integer kinematic points Z.
+
+        Returns (residues, valid), both of shape [primes, points]; valid is
+        False where a denominator vanishes modulo that prime, in which case
+        the residue is meaningless.
+        """
+        Z = np.asarray(Z, dtype=np.int64)
+        residues = np.empty((len(primes), Z.shape[0]), dtype=np.int64)
+        valid = np.empty((len(primes), Z.shape[0]), dtype=bool)
+        for row, p in enumerate(primes):
+            residues[row], valid[row] = self._run_modular(Z % p, p)
+        return residues, valid
+
+    def _run_modular(self, Zp: np.ndarray, p: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Run the program modulo p on reduced points Zp.
+
+        Registers hold (numerator, denominator) residue pairs, with None for a
+        denominator of one, so a single modular inverse is needed at the end
+        instead of one per division.
+        """
+        def times(x, y):
+            if x is None:
+                return y
+            if y is None:
+                return x
+            return x * y % p
+
+        points = Zp.shape[0]
+        registers: list = [None] * self.n_registers
+        for register, value in self.constants.items():
+            value = Fraction(value)
+            registers[register] = (np.int64(value.numerator % p),
+                                   None if value.denominator == 1 else np.int64(value.denominator % p))
+        for register, column in self.loads:
+            key = np.asarray(self.keys[column], dtype=np.intp) - 1
+            if len(key) == 4:
+                registers[register] = (det4_mod(Zp[:, key], p), None)
+            else:
+                first, second = Zp[:, key[0], :2], Zp[:, key[1], :2]
+                registers[register] = (det2_mod(first[:, 0], first[:, 1], second[:, 0], second[:, 1], p), None)
+        frees = self._frees
+        for position, (opcode, destination, first, second) in enumerate(self.instructions):
+            a, a_den = registers[first]
+            if opcode in ('add', 'sub'):
+                b, b_den = registers[second]
+                if opcode == 'sub':
+                    b = -b
+                if a_den is None and b_den is None:
+                    value = ((a + b) % p, None)
+                else:
+                    value = ((times(a, b_den) + times(b, a_den)) % p, times(a_den, b_den))
+            elif opcode == 'mul':
+                b, b_den = registers[second]
+                value = (a * b % p, times(a_den, b_den))
+            elif opcode == 'div':
+                b, b_den = registers[second]
+                value = (times(a, b_den), times(a_den, b))
+            elif opcode == 'neg':
+                value = (-a % p, a_den)
+            else:
+                exponent = self._integer_exponent(second)
+                if exponent < 0:
+                    a, a_den = (a_den if a_den is not None else np.int64(1)), a
+                    exponent = -exponent
+                value = (pow_mod(a, exponent, p), None if a_den is None else pow_mod(a_den, exponent, p))
+            registers[destination] = value
+            for register in frees[position]:
+                registers[register] = None
+        numerator, denominator = registers[self.output]
+        numerator = np.broadcast_to(numerator, (points,))
+        if denominator is None:
+            return numerator.astype(np.int64), np.ones(points, dtype=bool)
+        denominator = np.broadcast_to(denominator, (points,))
+        return numerator * inverse_mod(denominator, p) % p, denominator != 0
+
+    def evaluate_exact(self, Z: np.ndarray) -> List[Optional[Fraction]]:
+        """
+        Evaluate exactly with rational arithmetic at integer kinematic points.
+
+        Brackets are fraction-free integer determinants; the result has one
+        Fraction per point, or None where a denominator vanishes.
+        """
+        results: List[Optional[Fraction]] = []
+        for point in np.asarray(Z).tolist():
+            registers: list = [None] * self.n_registers
+            for register, value in self.constants.items():
+                registers[register] = Fraction(value)
+            for register, column in self.loads:
+                key = self.keys[column]
+                if len(key) == 4:
+                    registers[register] = Fraction(bareiss_det([point[i - 1] for i in key]))
+                else:
+                    registers[register] = Fraction(bareiss_det([point[i - 1][:2] for i in key]))
+            try:
+                for opcode, destination, first, second in self.instructions:
+                    if opcode == 'pow':
+                        registers[destination] = registers[first] ** self._integer_exponent(second)
+                    elif second is None:
+                        registers[destination] = _EXACT_OPS[opcode](registers[first])
+                    else:
+                        registers[destination] = _EXACT_OPS[opcode](registers[first], registers[second])
+            except ZeroDivisionError:
+                results.append(None)
+                continue
+            results.append(registers[self.output])
+        return results
+
+    def __call__(self, Z: np.ndarray, chunk_size: Optional[int] = None) -> np.ndarray:
+        """
+        Evaluate over Z, optionally in chunks of chunk_size points to bound
+        the size of intermediate arrays.
+        """
+        if chunk_size is None or Z.shape[0] <= chunk_size:
+            return self.evaluate(Z)
+        return np.concatenate([self.evaluate(Z[start:start + chunk_size])
+                               for start in range(0, Z.shape[0], chunk_size)])
+
+def compile_expression(node: ExpressionNode) -> CompiledExpression:
+    """
+    Lower an expression to a CompiledExpression.
+
+    Common subexpressions are eliminated: brackets are shared by sorted
+    indices (reordered brackets become a negation), equal constants share a
+    register and repeated operations on the same registers are emitted once,
+    with operands of add and mul ordered so that a*b and b*a coincide.
+    N-ary operators are lowered to chains of binary instructions.
+    """
+    keys: List[Tuple[int, ...]] = []
+    loads: List[Tuple[int, int]] = []
+    constants: Dict[int, float] = {}
+    instructions: List[tuple] = []
+    memo: Dict[tuple, int] = {}
+    registers: Dict[int, int] = {}
+    counter = [0]
+
+    def register_for(key: tuple) -> Tuple[int, bool]:
+        if key in memo:
+            return memo[key], False
+        memo[key] = counter[0]
+        counter[0] += 1
+        return memo[key], True
+
+    def constant(value: float) -> int:
+        register, new = register_for(('N', type(value), value))
+        if new:
+            constants[register] = value
+        return register
+
+    def emit(opcode: str, first: int, second: Optional[int] = None) -> int:
+        if opcode in _COMMUTATIVE and second < first:
+            first, second = second, first
+        register, new = register_for((opcode, first, second))
+        if new:
+            instructions.append((opcode, register, first, second))
+        return register
+
+    for item in iter_unique(node):
+        if isinstance(item, OperatorNode):
+            if item.op_type not in _FLOAT_OPS or item.op_type == 'neg':
+                raise ValueError(f"Cannot evaluate operator {item.op_type!r}")
+            if not item.operands:
+                raise ValueError(f"Cannot evaluate empty {item.op_type!r}")
+            result = registers[id(item.operands[0])]
+            for operand in item.operands[1:]:
+                result = emit(item.op_type, result, registers[id(operand)])
+        elif isinstance(item, BracketNode):
+            if item.bracket_type != 'angle' or len(item.indices) not in (2, 4):
+                raise ValueError(f"Cannot evaluate bracket {item.to_string()}")
+            key, sign = sort_indices(item.indices)
+            if sign == 0:
+                result = constant(0)
+            else:
+                result, new = register_for(('B', key))
+                if new:
+                    loads.append((result, len(keys)))
+                    keys.append(key)
+                if sign < 0:
+                    result = emit('neg', result)
+        elif isinstance(item, NumberNode):
+            result = constant(item.value)
+        else:
+            raise ValueError(f"Cannot evaluate {type(item).__name__} as a scalar")
+        registers[id(item)] = result
+    return CompiledExpression(keys, loads, constants, instructions, counter[0], registers[id(node)])
+
+def evaluate(node: ExpressionNode, Z: np.ndarray, cache: Optional[BracketCache] = None) -> np.ndarray:
+    """
+    Evaluate an expression at every kinematic point of Z, shape [points].
+
+    The expression is compiled first, so every determinant a bracket needs is
+    computed once in one vectorized pass (through cache, if given, which must
+    belong to Z) and repeated subexpressions are evaluated once. Compile with
+    compile_expression to evaluate the same expression over many batches.
+    """
+    return compile_expression(node).evaluate(Z, cache)
+
+def evaluate_modular(node: ExpressionNode, Z: np.ndarray,
+                     primes: Sequence[int] = PRIMES) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluate an expression modulo each prime at integer points Z; see
+    CompiledExpression.evaluate_modular.
+    """
+    return compile_expression(node).evaluate_modular(Z, primes)
+
+def evaluate_exact(node: ExpressionNode, Z: np.ndarray) -> List[Optional[Fraction]]:
+    """
+    Evaluate an expression with exact rational arithmetic at integer points Z.
+    """
+    return compile_expression(node).evaluate_exact(Z)
+
+def probably_equal(lhs: ExpressionNode, rhs: ExpressionNode, points: int = 16,
+                   primes: Sequence[int] = PRIMES[:2], seed: Optional[int] = None) -> bool:
+    """
+    Test whether two expressions are equal as rational functions of the
+    momentum twistors (Schwartz-Zippel).
+
+    lhs - rhs is compiled once, so both sides share their brackets, and is
+    evaluated modulo each prime at random points with entries in [0, p).
+    A nonzero residue proves the expressions differ; if every residue
+    vanishes they are equal except with probability about degree / p per
+    point. Points where a denominator vanishes are skipped.
+    """
+    program = compile_expression(OperatorNode('sub', [lhs, rhs]))
+    n = max((max(key) for key in program.keys), default=1)
+    rng = np.random.default_rng(seed)
+    Z = rng.integers(0, min(primes), size=(points, n, 4), dtype=np.int64)
+    residues, valid = program.evaluate_modular(Z, primes)
+    if not valid.any():
+        raise ValueError("Every sample point hit a vanishing denominator")
+    return not residues[valid].any()
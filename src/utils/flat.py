@@ -0,0 +1,265 @@
+"""
+Flat array encoding of momentum twistor expression trees.
+Module stores whole forests of expressions as NumPy arrays in prefix order.
+"""
+from typing import List, Sequence
+
+import numpy as np
+
+from src.utils.parser import (
+    BRACKET_CODES,
+    BRACKET_TYPES,
+    OPERATOR_CODES,
+    OPERATORS,
+    BracketNode,
+    DualTwistorNode,
+    ExpressionNode,
+    InfinityTwistorNode,
+    NodeKind,
+    NumberNode,
+    OperatorNode,
+    TwistorNode,
+)
+
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+class FlatExpression:
+    """
+    Struct-of-arrays encoding of one or more expression trees.
+
+    Nodes are laid out in prefix order, so the first child of node i is
+    node i + 1 and each further child starts where the previous child's
+    subtree ends (i + sizes[i] is the next sibling of node i).
+
+    Per-node arrays:
+        kinds   -- NodeKind of the node (uint8)
+        codes   -- operator code, twistor index or bracket type code;
+                   1 for integer-valued numbers, 0 for floats (int32)
+        arities -- number of operands, 0 for leaves (int32)
+        sizes   -- number of nodes in the subtree rooted at the node (int32)
+        payload -- row into brackets, integers (integer numbers) or
+                   numbers (float numbers), -1 otherwise (int32)
+
+    Side tables:
+        brackets -- bracket indices padded with -1, shape [rows, width] (int32)
+        integers -- integer constant values (int64)
+        numbers  -- float constant values (float64)
+        roots    -- position of each tree's root node (int64)
+
+    Integer constants are kept exactly; one outside the int64 range raises
+    ValueError.
+    """
+    __slots__ = ('kinds', 'codes', 'arities', 'sizes', 'payload',
+                 'brackets', 'integers', 'numbers', 'roots')
+
+    def __init__(self, kinds: np.ndarray, codes: np.ndarray, arities: np.ndarray,
+                 sizes: np.ndarray, payload: np.ndarray, brackets: np.ndarray,
+                 integers: np.ndarray, numbers: np.ndarray, roots: np.ndarray):
+        self.kinds = kinds
+        self.codes = codes
+        self.arities = arities
+        self.sizes = sizes
+        self.payload = payload
+        self.brackets = brackets
+        self.integers = integers
+        self.numbers = numbers
+        self.roots = roots
+
+    @classmethod
+    def from_tree(cls, node: ExpressionNode) -> 'FlatExpression':
+        """
+        Encode a single expression tree.
+        """
+        return cls.from_trees([node])
+
+    @classmethod
+    def from_trees(cls, trees: Sequence[ExpressionNode]) -> 'FlatExpression':
+        """
+        Encode a sequence of expression trees into one set of arrays.
+        """
+        kinds = []
+        codes = []
+        arities = []
+        payload = []
+        brackets = []
+        integers = []
+        numbers = []
+        roots = []
+        for root in trees:
+            roots.append(len(kinds))
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                if isinstance(node, OperatorNode):
+                    if node.op_type not in OPERATOR_CODES:
+                        raise ValueError(f"Cannot encode operator {node.op_type!r}")
+                    kinds.append(NodeKind.OPERATOR)
+                    codes.append(OPERATOR_CODES[node.op_type])
+                    arities.append(len(node.operands))
+                    payload.append(-1)
+                    stack.extend(reversed(node.operands))
+                    continue
+                arities.append(0)
+                if isinstance(node, BracketNode):
+                    if node.bracket_type not in BRACKET_CODES:
+                        raise ValueError(f"Cannot encode bracket {node.bracket_type!r}")
+                    kinds.append(NodeKind.BRACKET)
+                    codes.append(BRACKET_CODES[node.bracket_type])
+                    payload.append(len(brackets))
+                    brackets.append(node.indices)
+                elif isinstance(node, NumberNode):
+                    kinds.append(NodeKind.NUMBER)
+                    if isinstance(node.value, int):
+                        if not _INT64_MIN <= node.value <= _INT64_MAX:
+                            raise ValueError(f"Integer constant {node.value} does not fit in int64")
+                        codes.append(1)
+                        payload.append(len(integers))
+                        integers.append(node.value)
+                    else:
+                        codes.append(0)
+                        payload.append(len(numbers))
+                        numbers.append(node.value)
+                elif isinstance(node, TwistorNode):
+                    kinds.append(NodeKind.TWISTOR)
+                    codes.append(node.index)
+                    payload.append(-1)
+                elif isinstance(node, DualTwistorNode):
+                    kinds.append(NodeKind.DUAL_TWISTOR)
+                    codes.append(node.index)
+                    payload.append(-1)
+                elif isinstance(node, InfinityTwistorNode):
+                    kinds.append(NodeKind.INFINITY_TWISTOR)
+                    codes.append(0)
+                    payload.append(-1)
+                else:
+                    raise ValueError(f"Cannot encode node {type(node).__name__}")
+
+        width = max((len(indices) for indices in brackets), default=0)
+        bracket_array = np.full((len(brackets), width), -1, dtype=np.int32)
+        for row, indices in enumerate(brackets):
+            bracket_array[row, :len(indices)] = indices
+
+        arity_array = np.asarray(arities, dtype=np.int32)
+        return cls(
+            kinds=np.asarray(kinds, dtype=np.uint8),
+            codes=np.asarray(codes, dtype=np.int32),
+            arities=arity_array,
+            sizes=_subtree_sizes(arity_array),
+            payload=np.asarray(payload, dtype=np.int32),
+            brackets=bracket_array,
+            integers=np.asarray(integers, dtype=np.int64),
+            numbers=np.asarray(numbers, dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.int64),
+        )
+
+    @classmethod
+    def concatenate(cls, parts: Sequence['FlatExpression']) -> 'FlatExpression':
+        """
+        Join several encodings into one, keeping the order of their trees.
+        """
+        if not parts:
+            return cls.from_trees([])
+        width = max(part.brackets.shape[1] for part in parts)
+        node_offset = 0
+        bracket_offset = 0
+        integer_offset = 0
+        number_offset = 0
+        payload = []
+        brackets = []
+        roots = []
+        for part in parts:
+            rows = np.where(part.kinds == NodeKind.BRACKET, bracket_offset,
+                            np.where(part.codes == 1, integer_offset, number_offset))
+            payload.append(np.where(part.payload >= 0, part.payload + rows, -1).astype(np.int32))
+            padded = np.full((len(part.brackets), width), -1, dtype=np.int32)
+            padded[:, :part.brackets.shape[1]] = part.brackets
+            brackets.append(padded)
+            roots.append(part.roots + node_offset)
+            node_offset += len(part.kinds)
+            bracket_offset += len(part.brackets)
+            integer_offset += len(part.integers)
+            number_offset += len(part.numbers)
+        return cls(
+            kinds=np.concatenate([part.kinds for part in parts]),
+            codes=np.concatenate([part.codes for part in parts]),
+            arities=np.concatenate([part.arities for part in parts]),
+            sizes=np.concatenate([part.sizes for part in parts]),
+            payload=np.concatenate(payload),
+            brackets=np.concatenate(brackets),
+            integers=np.concatenate([part.integers for part in parts]),
+            numbers=np.concatenate([part.numbers for part in parts]),
+            roots=np.concatenate(roots),
+        )
+
+    def __len__(self) -> int:
+        """
+        Number of trees in the encoding.
+        """
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Total size of the underlying arrays in bytes.
+        """
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    def to_tree(self, tree: int = 0) -> ExpressionNode:
+        """
+        Decode a single tree back into expression nodes.
+        """
+        start = int(self.roots[tree])
+        return self._decode(start, start + int(self.sizes[start]))
+
+    def to_trees(self) -> List[ExpressionNode]:
+        """
+        Decode every tree back into expression nodes.
+        """
+        return [self.to_tree(tree) for tree in range(len(self))]
+
+    def _decode(self, start: int, end: int) -> ExpressionNode:
+        """
+        Rebuild the nodes in [start, end) bottom-up without recursion.
+        """
+        kinds = self.kinds[start:end].tolist()
+        codes = self.codes[start:end].tolist()
+        arities = self.arities[start:end].tolist()
+        payload = self.payload[start:end].tolist()
+        built: List[ExpressionNode] = []
+        for i in range(end - start - 1, -1, -1):
+            kind = kinds[i]
+            if kind == NodeKind.OPERATOR:
+                arity = arities[i]
+                operands = built[-arity:][::-1] if arity else []
+                del built[len(built) - arity:]
+                built.append(OperatorNode(OPERATORS[codes[i]], operands))
+            elif kind == NodeKind.BRACKET:
+                indices = self.brackets[payload[i]]
+                built.append(BracketNode(BRACKET_TYPES[codes[i]],
+                                         indices[indices >= 0].tolist()))
+            elif kind == NodeKind.NUMBER:
+                if codes[i]:
+                    built.append(NumberNode(int(self.integers[payload[i]])))
+                else:
+                    built.append(NumberNode(float(self.numbers[payload[i]])))
+            elif kind == NodeKind.TWISTOR:
+                built.append(TwistorNode(codes[i]))
+            elif kind == NodeKind.DUAL_TWISTOR:
+                built.append(DualTwistorNode(codes[i]))
+            else:
+                built.append(InfinityTwistorNode())
+        return built[0]
+
+def _subtree_sizes(arities: np.ndarray) -> np.ndarray:
+    """
+    Compute subtree sizes for nodes in prefix order from their arities.
+    """
+    sizes = [1] * len(arities)
+    pending: List[int] = []
+    for i, arity in zip(range(len(arities) - 1, -1, -1), arities[::-1].tolist()):
+        size = 1
+        for _ in range(arity):
+            size += pending.pop()
+        sizes[i] = size
+        pending.append(size)
+    return np.asarray(sizes, dtype=np.int32)
@@ -0,0 +1,201 @@
+"""
+Momentum twistor identities among four-brackets.
+Module enumerates the five-term Plücker (Schouten) relations for n points,
+stores them with an index from each bracket to the relations containing it in
+memory-mapped .npy files, and builds them as expression trees.
+
+For indices a < b < c < d < e and any f, g, h the relation reads
+    <bcde><afgh> - <acde><bfgh> + <abde><cfgh> - <abce><dfgh> + <abcd><efgh> = 0
+A relation is stored as a tuple of terms (coefficient, first, second), where
+first and second are sorted index tuples with first < second, vanishing
+brackets are dropped, equal products are merged and terms are ordered by
+their brackets.
+
+The index numbers the brackets of sorted indices i1 < i2 < i3 < i4 by their
+colexicographic rank C(i1-1, 1) + C(i2-1, 2) + C(i3-1, 3) + C(i4-1, 4), so the
+C(n, 4) brackets of n points take the ids 0 .. C(n, 4) - 1 for every n.
+"""
+import itertools
+import math
+import os
+import tempfile
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.utils.parser import BracketNode, ExpressionNode, NumberNode, OperatorNode, sort_indices
+
+Key = Tuple[int, ...]
+Term = Tuple[int, Key, Key]
+Relation = Tuple[Term, ...]
+
+def plucker_relation(five: Iterable[int], three: Iterable[int]) -> Relation:
+    """
+    Canonical terms of the five-term relation for the given index sets.
+    """
+    five = tuple(five)
+    three = tuple(three)
+    products: Dict[Tuple[Key, Key], int] = {}
+    for i, index in enumerate(five):
+        first, first_sign = sort_indices(five[:i] + five[i + 1:])
+        second, second_sign = sort_indices((index,) + three)
+        sign = (-1) ** i * first_sign * second_sign
+        if sign == 0:
+            continue
+        pair = (first, second) if first <= second else (second, first)
+        products[pair] = products.get(pair, 0) + sign
+    return tuple((coefficient, first, second)
+                 for (first, second), coefficient in sorted(products.items()) if coefficient)
+
+@lru_cache(maxsize=None)
+def plucker_relations(n: int) -> Tuple[Relation, ...]:
+    """
+    Every distinct five-term relation with at least three terms among the
+    four-brackets of n points, in a fixed order.
+    """
+    relations = {}
+    points = range(1, n + 1)
+    for five in itertools.combinations(points, 5):
+        for three in itertools.combinations(points, 3):
+            relation = plucker_relation(five, three)
+            if len(relation) < 3:
+                continue
+            # A relation and its negation are the same identity.
+            if relation[0][0] < 0:
+                relation = tuple((-coefficient, first, second)
+                                 for coefficient, first, second in relation)
+            relations.setdefault(relation, None)
+    return tuple(relations)
+
+def product_node(coefficient: int, factors: List[Key]) -> ExpressionNode:
+    """
+    coefficient times the product of the angle brackets with the given indices.
+    """
+    operands: List[ExpressionNode] = [BracketNode('angle', list(key)) for key in factors]
+    if coefficient != 1:
+        operands.insert(0, NumberNode(coefficient))
+    return operands[0] if len(operands) == 1 else OperatorNode('mul', operands)
+
+def relation_node(relation: Relation) -> ExpressionNode:
+    """
+    The sum of a relation's terms, which vanishes identically.
+    """
+    return OperatorNode('add', [product_node(coefficient, [first, second])
+                                for coefficient, first, second in relation])
+
+def bracket_id(indices: Sequence[int]) -> int:
+    """
+    Colexicographic rank of a bracket given by its sorted indices.
+    """
+    return sum(math.comb(index - 1, position) for position, index in enumerate(indices, 1))
+
+def bracket_keys(n: int) -> np.ndarray:
+    """
+    Sorted indices of every n-point four-bracket, row i holding bracket id i.
+    """
+    keys = sorted(itertools.combinations(range(1, n + 1), 4), key=lambda key: key[::-1])
+    return np.asarray(keys, dtype=np.int32).reshape(-1, 4)
+
+def default_cache_dir() -> str:
+    """
+    Directory for precomputed tables: $MOMENTUM_TWISTORS_CACHE, or
+    ~/.cache/momentum_twistors.
+    """
+    return os.environ.get('MOMENTUM_TWISTORS_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'momentum_twistors'))
+
+_INDEX_ARRAYS = ('terms', 'indptr', 'relation_ids')
+
+class IdentityIndex:
+    """
+    Every five-term Plücker relation for n points, indexed by bracket.
+
+    Arrays:
+        terms        -- [relations, 5, 3] rows of (coefficient, first bracket
+                        id, second bracket id), padded with (0, -1, -1) (int32)
+        indptr       -- [C(n, 4) + 1] CSR offsets into relation_ids (int64)
+        relation_ids -- ids of the relations containing each bracket, in
+                        increasing order (int32)
+    """
+    def __init__(self, n: int, terms: np.ndarray, indptr: np.ndarray, relation_ids: np.ndarray):
+        self.n = n
+        self.terms = terms
+        self.indptr = indptr
+        self.relation_ids = relation_ids
+        self.keys = bracket_keys(n)
+
+    @classmethod
+    def build(cls, n: int) -> 'IdentityIndex':
+        """
+        Enumerate the relations for n points in memory.
+        """
+        relations = plucker_relations(n)
+        terms = np.zeros((len(relations), 5, 3), dtype=np.int32)
+        terms[:, :, 1:] = -1
+        for row, relation in enumerate(relations):
+            for position, (coefficient, first, second) in enumerate(relation):
+                terms[row, position] = (coefficient, bracket_id(first), bracket_id(second))
+
+        # Each relation is listed once under every distinct bracket it contains.
+        rows = np.repeat(np.arange(len(relations), dtype=np.int32), 10)
+        brackets = terms[:, :, 1:].reshape(-1)
+        pairs = np.unique(np.stack([brackets, rows], axis=1)[brackets >= 0], axis=0)
+        counts = np.bincount(pairs[:, 0], minlength=math.comb(n, 4))
+        indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(n, terms, indptr, pairs[:, 1].astype(np.int32))
+
+    @classmethod
+    def load(cls, n: int, cache_dir: Optional[str] = None) -> 'IdentityIndex':
+        """
+        Memory-map the stored index for n points, building and saving it
+        first if the cache directory does not hold it yet.
+        """
+        cache_dir = cache_dir or default_cache_dir()
+        paths = [os.path.join(cache_dir, f"plucker-{n}-{name}.npy") for name in _INDEX_ARRAYS]
+        if not all(os.path.exists(path) for path in paths):
+            cls.build(n).save(cache_dir)
+        return cls(n, *(np.load(path, mmap_mode='r') for path in paths))
+
+    def save(self, cache_dir: str):
+        """
+        Write the index arrays as .npy files. Each file is written under a
+        temporary name and renamed, so concurrent writers never expose a
+        partial file.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in _INDEX_ARRAYS:
+            handle, temporary = tempfile.mkstemp(suffix='.npy', dir=cache_dir)
+            with os.fdopen(handle, 'wb') as output:
+                np.save(output, getattr(self, name))
+            os.replace(temporary, os.path.join(cache_dir, f"plucker-{self.n}-{name}.npy"))
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def relations_containing(self, indices: Sequence[int]) -> np.ndarray:
+        """
+        Ids of the relations in which the bracket with the given indices
+        occurs, in any index order. Constant time; the result is a view.
+        """
+        key, sign = sort_indices(indices)
+        if sign == 0 or len(key) != 4 or key[0] < 1 or key[-1] > self.n:
+            return self.relation_ids[:0]
+        i = bracket_id(key)
+        return self.relation_ids[self.indptr[i]:self.indptr[i + 1]]
+
+    def relation(self, relation_id: int) -> Relation:
+        """
+        Terms of a relation in the tuple form of plucker_relation.
+        """
+        keys = self.keys
+        return tuple((int(coefficient), tuple(keys[first].tolist()), tuple(keys[second].tolist()))
+                     for coefficient, first, second in self.terms[relation_id].tolist() if coefficient)
+
+@lru_cache(maxsize=None)
+def identity_index(n: int, cache_dir: Optional[str] = None) -> IdentityIndex:
+    """
+    The stored identity index for n points, loaded once per process.
+    """
+    return IdentityIndex.load(n, cache_dir)
@@ -2,9 +2,13 @@
 Parser for momentum twistor expressions.
 Module handles parsing, tokenization, and manipulation of momentum twistor expressions.
 """
+import multiprocessing
+import os
 import re
-from enum import Enum
-from typing import List, Dict, Union, Tuple, Optional
+from collections import deque
+from functools import lru_cache
+from enum import Enum, IntEnum
+from typing import Any, Iterable, Iterator, List, Dict, Union, Tuple, Optional
 
 class TokenType(Enum):
     """
@@ -18,11 +22,31 @@ class TokenType(Enum):
     BRACKET_CLOSE = "BRACKET_CLOSE"
     DOT = "DOT"
     INFINITY_TWISTOR = "INFINITY_TWISTOR"
+    BRACKET = "BRACKET"
+
+class NodeKind(IntEnum):
+    """
+    Integer codes for expression node classes, used by array encodings.
+    """
+    OPERATOR = 0
+    TWISTOR = 1
+    DUAL_TWISTOR = 2
+    NUMBER = 3
+    BRACKET = 4
+    INFINITY_TWISTOR = 5
+
+# Operator and bracket names in code order for array encodings.
+OPERATORS = ('add', 'sub', 'mul', 'div', 'pow', 'dot')
+BRACKET_TYPES = ('angle', 'square')
+OPERATOR_CODES = {op: code for code, op in enumerate(OPERATORS)}
+BRACKET_CODES = {bracket: code for code, bracket in enumerate(BRACKET_TYPES)}
 
 class Token:
     """
     Represents a token in a momentum twistor expression.
     """
+    __slots__ = ('type', 'value', 'indices')
+
     def __init__(self, type : TokenType, value :str, indices :Optional[List[int]] = None):
         self.type = type
         self.value = value
@@ -32,17 +56,217 @@ class Token:
         if self.indices:
             return f"{self.type.value}({self.value}{self.indices})"
         return f"{self.type.value}({self.value})"
-    
+
+# Single master pattern for the lexer. Leading whitespace is absorbed into
+# each match and the catch-all error group only matches characters nothing
+# else accepts.
+_TOKEN_PATTERN = re.compile(r"""
+  \s*(?:
+    (?P<angle><[\d\s,]*>)
+  | (?P<square>\[[\d\s,]*\])
+  | (?P<number>(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?)
+  | (?P<operator>[-+*/^])
+  | (?P<open>\()
+  | (?P<close>\))
+  | (?P<twistor>Z_?(?:\{\s*\d+\s*\}|\d+))
+  | (?P<dual>W_?(?:\{\s*\d+\s*\}|\d+))
+  | (?P<infinity>I)
+  | (?P<dot>\.)
+  | (?P<end>$)
+  | (?P<error>.)
+)""", re.VERBOSE | re.DOTALL)
+_DIGITS = re.compile(r"\d+")
+
+def _bracket_indices(text: str) -> List[int]:
+    """
+    Read the indices of a bracket such as "<1, 2, 3, 4>" or "<1234>".
+    Without commas every digit is a separate index.
+    """
+    if ',' in text:
+        return [int(index) for index in _DIGITS.findall(text)]
+    return [int(digit) for digit in text if digit.isdigit()]
+
+def iter_tokens(text: str) -> Iterator[Token]:
+    """
+    Lazily split an expression string into tokens in a single pass.
+
+    Brackets such as <1,2,3,4> and [2,3,4,5] become single BRACKET tokens
+    carrying their indices; twistors Z_{i}/Z_i/Zi and dual twistors W_{i}
+    carry their index. Parentheses become BRACKET_OPEN/BRACKET_CLOSE.
+    """
+    bracket_cache: Dict[str, List[int]] = {}
+    for match in _TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'angle' or kind == 'square':
+            indices = bracket_cache.get(value)
+            if indices is None:
+                indices = bracket_cache[value] = _bracket_indices(value)
+            yield Token(TokenType.BRACKET, kind, indices[:])
+        elif kind == 'operator':
+            yield Token(TokenType.OPERATOR, value)
+        elif kind == 'number':
+            yield Token(TokenType.NUMBER, value)
+        elif kind == 'open':
+            yield Token(TokenType.BRACKET_OPEN, value)
+        elif kind == 'close':
+            yield Token(TokenType.BRACKET_CLOSE, value)
+        elif kind == 'twistor':
+            yield Token(TokenType.TWISTOR, 'Z', [int(_DIGITS.search(value).group())])
+        elif kind == 'dual':
+            yield Token(TokenType.DUAL_TWISTOR, 'W', [int(_DIGITS.search(value).group())])
+        elif kind == 'infinity':
+            yield Token(TokenType.INFINITY_TWISTOR, value)
+        elif kind == 'dot':
+            yield Token(TokenType.DOT, value)
+        elif kind == 'error':
+            raise ValueError(f"Unexpected character {value!r} at position {match.start(kind)}")
+
+def tokenize(text: str) -> List[Token]:
+    """
+    Split an expression string into a list of tokens.
+    """
+    return list(iter_tokens(text))
+
+# Slots that only cache derived values and may be filled in on frozen nodes.
+_CACHE_SLOTS = ('_hash', '_prefix', '_string')
+_set_slot = object.__setattr__
+
 class ExpressionNode:
     """
     Base class for nodes in the expression tree.
+
+    Nodes declare __slots__ so large corpora of expressions do not pay for a
+    per-instance __dict__.
+
+    Equality and hashing are structural. Hashes are computed once and cached,
+    so a node must not be mutated after it has been hashed or compared. The
+    cached hash is not pickled and is recomputed in the receiving process.
+
+    freeze() makes a tree immutable (operands and bracket indices become
+    tuples and attributes can no longer be assigned); frozen operator nodes
+    cache their prefix tokens and string form the first time they are
+    serialized. Leaves holding only scalars are frozen from construction.
     """
+    __slots__ = ('_hash',)
+
+    def __setattr__(self, name: str, value):
+        if name not in _CACHE_SLOTS and self.frozen:
+            raise AttributeError(f"Cannot set {name!r} on a frozen {type(self).__name__}")
+        _set_slot(self, name, value)
+
+    def __delattr__(self, name: str):
+        if name not in _CACHE_SLOTS and self.frozen:
+            raise AttributeError(f"Cannot delete {name!r} on a frozen {type(self).__name__}")
+        object.__delattr__(self, name)
+
+    @property
+    def frozen(self) -> bool:
+        """
+        Whether the node has been frozen.
+        """
+        return True
+
+    def freeze(self) -> 'ExpressionNode':
+        """
+        Freeze the node and every node below it, returning self.
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.frozen:
+                continue
+            if isinstance(node, OperatorNode):
+                _set_slot(node, 'operands', tuple(node.operands))
+                _set_slot(node, '_frozen', True)
+                stack.extend(node.operands)
+            elif isinstance(node, BracketNode):
+                _set_slot(node, 'indices', tuple(node.indices))
+        return self
+
+    def _key(self) -> tuple:
+        """
+        Hashable description of a leaf node's contents.
+        """
+        raise NotImplementedError("Subclasses must implement _key")
+
+    def __hash__(self) -> int:
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(self._key())
+            return self._hash
+
+    def __getstate__(self) -> dict:
+        """
+        Slot values for pickling, without the cached hash: it is built from
+        salted str hashes, so it is only valid in the process that computed it.
+        """
+        state = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if name != '_hash' and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            _set_slot(self, name, value)
+
+    def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, ExpressionNode):
+            return NotImplemented
+        stack = [(self, other)]
+        while stack:
+            left, right = stack.pop()
+            if left is right:
+                continue
+            if hash(left) != hash(right):
+                return False
+            is_operator = isinstance(left, OperatorNode)
+            if is_operator != isinstance(right, OperatorNode):
+                return False
+            if is_operator:
+                if (left.op_type != right.op_type
+                        or len(left.operands) != len(right.operands)):
+                    return False
+                stack.extend(zip(left.operands, right.operands))
+            elif left._key() != right._key():
+                return False
+        return True
+
     def to_prefix_notation(self) -> List[str]:
         """
         Converts the node to prefix notation.
         """
         raise NotImplementedError("Subvlasses must implement to_prefix_notation")
     
+    def iter_prefix(self) -> Iterator[str]:
+        """
+        Lazily yield the prefix notation tokens of the node.
+
+        Uses an explicit stack, so only the pending operands are held in
+        memory rather than the full token list. Operators with more than two
+        operands are written as a left fold of binary operators
+        ("add add a b c"), which keeps the notation decodable.
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, OperatorNode):
+                cached = getattr(node, '_prefix', None)
+                if cached is not None:
+                    yield from cached
+                    continue
+                yield node.op_type
+                for _ in range(len(node.operands) - 2):
+                    yield node.op_type
+                stack.extend(reversed(node.operands))
+            else:
+                yield from node.to_prefix_notation()
+    
     def to_string(self) -> str:
         """
         Convert to string representation.
@@ -53,42 +277,166 @@ class OperatorNode(ExpressionNode):
     """
     Node representing an operator in the expression tree.
     """
+    __slots__ = ('op_type', 'operands', '_frozen', '_prefix', '_string')
+
     def __init__(self, op_type: str, operands: List[ExpressionNode]):
-        self.op_type = op_type
-        self.operands = operands
+        _set_slot(self, 'op_type', op_type)
+        _set_slot(self, 'operands', operands)
+    
+    @property
+    def frozen(self) -> bool:
+        return getattr(self, '_frozen', False)
+    
+    def __hash__(self) -> int:
+        """
+        Structural hash, computed bottom-up without recursion and cached on
+        every operator node of the subtree.
+        """
+        try:
+            return self._hash
+        except AttributeError:
+            pass
+        stack = [(self, False)]
+        while stack:
+            node, ready = stack.pop()
+            if ready:
+                node._hash = hash((node.op_type, tuple(map(hash, node.operands))))
+                continue
+            stack.append((node, True))
+            for operand in node.operands:
+                if isinstance(operand, OperatorNode) and not hasattr(operand, '_hash'):
+                    stack.append((operand, False))
+        return self._hash
     
     def to_prefix_notation(self) -> List[str]:
         """
         Convert to prefix notation.
+
+        Drains iter_prefix into a single output list, so deep expressions
+        never hit the recursion limit.
+        """
+        if self.frozen:
+            return list(self._prefix_tokens())
+        return list(self.iter_prefix())
+
+    def _prefix_tokens(self) -> Tuple[str, ...]:
+        """
+        Prefix tokens of a frozen node, computed once.
+        """
+        try:
+            return self._prefix
+        except AttributeError:
+            self._prefix = tuple(self.iter_prefix())
+            return self._prefix
+
+    def prefix_length(self) -> int:
+        """
+        Number of prefix notation tokens, O(1) after the first call on a
+        frozen node.
         """
-        result = [self.op_type]
-        for operand in self.operands:
-            result.extend(operand.to_prefix_notation())
-        return result
+        if self.frozen:
+            return len(self._prefix_tokens())
+        return sum(1 for _ in self.iter_prefix())
     
     def to_string(self) -> str:
         """
         Convert to string representation.
+
+        Writes into a single buffer with an explicit stack and only emits
+        the parentheses that operator precedence requires, so the output
+        parses back to an equal expression. Frozen nodes cache the result.
         """
-        if self.op_type == 'add':
-            return '(' + ' + '.join([operand.to_string() for operand in self.operands]) +')'
-        elif self.op_type == 'sub':
-            return f"({self.operands[0].to_string()} - {self.operands[1].to_string()})"
-        elif self.op_type == 'mul':
-            return ' * '.join([operand.to_string() for operand in self.operands])
-        elif self.op_type == 'div':
-            return f"({self.operands[0].to_string()} / {self.operands[1].to_string()})"
-        elif self.op_type == 'pow':
-            return f"({self.operands[0].to_string()}^{self.operands[1].to_string()})"
-        else:
-            return f"{self.op_type}({', '.join([operand.to_string() for operand in self.operands])})"
+        cached = getattr(self, '_string', None)
+        if cached is not None:
+            return cached
+        buffer = []
+        stack = [(self, False)]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                buffer.append(item)
+                continue
+            node, wrap = item
+            if isinstance(node, OperatorNode):
+                text = getattr(node, '_string', None)
+            else:
+                text = node.to_string()
+            if text is not None:
+                buffer.append(f"({text})" if wrap else text)
+                continue
+            infix = _INFIX.get(node.op_type)
+            if infix is None:
+                parts = [f"{node.op_type}("]
+                for position, operand in enumerate(node.operands):
+                    if position:
+                        parts.append(', ')
+                    parts.append((operand, False))
+                parts.append(')')
+            else:
+                separator, precedence = infix
+                parts = ['('] if wrap else []
+                # pow is right associative, so a chain of more than two
+                # operands is written as the left fold it denotes.
+                folded = node.op_type == 'pow'
+                if folded:
+                    parts.extend(['('] * (len(node.operands) - 2))
+                for position, operand in enumerate(node.operands):
+                    if position:
+                        if folded and position > 1:
+                            parts.append(')')
+                        parts.append(separator)
+                    parts.append((operand, _needs_parentheses(node.op_type, precedence, operand, position)))
+                if wrap:
+                    parts.append(')')
+            stack.extend(reversed(parts))
+        text = ''.join(buffer)
+        if self.frozen:
+            self._string = text
+        return text
+
+# Infix operator -> (separator, precedence) used by OperatorNode.to_string.
+_INFIX = {
+    'add': (' + ', 1),
+    'sub': (' - ', 1),
+    'mul': (' * ', 2),
+    'div': (' / ', 2),
+    'dot': (' . ', 2),
+    'pow': ('^', 4),
+}
+# Operators whose right operand may be a node of the same operator without
+# parentheses, since the parser flattens a + (b + c) into one sum anyway.
+_ASSOCIATIVE_INFIX = ('add', 'mul')
+_ATOM_PRECEDENCE = 5
+_NEGATIVE_PRECEDENCE = 3
+
+def _needs_parentheses(op_type: str, precedence: int, operand: ExpressionNode, position: int) -> bool:
+    """
+    Whether operand must be parenthesised at position under op_type.
+    """
+    if isinstance(operand, OperatorNode):
+        infix = _INFIX.get(operand.op_type)
+        operand_precedence = infix[1] if infix else _ATOM_PRECEDENCE
+    elif isinstance(operand, NumberNode) and operand.value < 0:
+        operand_precedence = _NEGATIVE_PRECEDENCE
+    else:
+        return False
+    if operand_precedence != precedence:
+        return operand_precedence < precedence
+    if op_type == 'pow':
+        return position == 0
+    return position > 0 and not (operand.op_type == op_type and op_type in _ASSOCIATIVE_INFIX)
 
 class TwistorNode(ExpressionNode):
     """
     Node representing a twistor variable.
     """
+    __slots__ = ('index',)
+
     def __init__(self, index: int):
-        self.index = index
+        _set_slot(self, 'index', index)
+    
+    def _key(self) -> tuple:
+        return ('Z', self.index)
     
     def to_prefix_notation(self) -> List[str]:
         """
@@ -106,8 +454,13 @@ class DualTwistorNode(ExpressionNode):
     """
     Node representing a dual twistor variable.
     """
+    __slots__ = ('index',)
+
     def __init__(self, index: int):
-        self.index = index
+        _set_slot(self, 'index', index)
+    
+    def _key(self) -> tuple:
+        return ('W', self.index)
     
     def to_prefix_notation(self) -> List[str]:
         """
@@ -125,8 +478,13 @@ class NumberNode(ExpressionNode):
     """
     Node representing a constant.
     """
+    __slots__ = ('value',)
+
     def __init__(self, value: float):
-        self.value = value
+        _set_slot(self, 'value', value)
+    
+    def _key(self) -> tuple:
+        return ('N', type(self.value), self.value)
     
     def to_prefix_notation(self) -> List[str]:
         """
@@ -144,9 +502,18 @@ class BracketNode(ExpressionNode):
     """
     Node representing momentum twistor bracket.
     """
+    __slots__ = ('bracket_type', 'indices')
+
     def __init__(self, bracket_type:str, indices:List[int]):
-        self.bracket_type = bracket_type # angle/square
-        self.indices = indices # 4 for momentum twistors
+        _set_slot(self, 'bracket_type', bracket_type) # angle/square
+        _set_slot(self, 'indices', indices) # 4 for momentum twistors
+    
+    @property
+    def frozen(self) -> bool:
+        return isinstance(self.indices, tuple)
+    
+    def _key(self) -> tuple:
+        return (self.bracket_type, tuple(self.indices))
     
     def to_prefix_notation(self) -> List[str]:
         """
@@ -170,6 +537,11 @@ class InfinityTwistorNode(ExpressionNode):
     """
     Node representing infinity twistor.
     """
+    __slots__ = ()
+
+    def _key(self) -> tuple:
+        return ('I',)
+
     def to_prefix_notation(self) -> List[str]:
         """
         Convert to prefix notation.
@@ -180,4 +552,539 @@ class InfinityTwistorNode(ExpressionNode):
         """
         Convert to string representation.
         """
-        return "I"
\ No newline at end of file
+        return "I"
+
+class NodeInterner:
+    """
+    Factory that shares identical nodes (hash-consing).
+
+    Leaves with the same contents are created once and reused, so a corpus
+    of n-point expressions only holds a few hundred distinct leaves and
+    interned nodes can be compared by identity. Operator nodes built through
+    operator() are shared as well when their interned operands are the same
+    objects. intern() deduplicates a whole tree into a DAG this way.
+    Interned nodes are shared, so they are frozen on creation.
+    """
+    __slots__ = ('_leaves', '_operators')
+
+    def __init__(self):
+        self._leaves: Dict[tuple, ExpressionNode] = {}
+        self._operators: Dict[tuple, OperatorNode] = {}
+
+    def __len__(self) -> int:
+        return len(self._leaves) + len(self._operators)
+
+    def clear(self):
+        """
+        Drop every interned node.
+        """
+        self._leaves.clear()
+        self._operators.clear()
+
+    def twistor(self, index: int) -> TwistorNode:
+        """
+        Return the shared twistor node Z_index.
+        """
+        key = ('Z', index)
+        node = self._leaves.get(key)
+        if node is None:
+            node = self._leaves[key] = TwistorNode(index).freeze()
+        return node
+
+    def dual_twistor(self, index: int) -> DualTwistorNode:
+        """
+        Return the shared dual twistor node W_index.
+        """
+        key = ('W', index)
+        node = self._leaves.get(key)
+        if node is None:
+            node = self._leaves[key] = DualTwistorNode(index).freeze()
+        return node
+
+    def infinity_twistor(self) -> InfinityTwistorNode:
+        """
+        Return the shared infinity twistor node.
+        """
+        key = ('I',)
+        node = self._leaves.get(key)
+        if node is None:
+            node = self._leaves[key] = InfinityTwistorNode().freeze()
+        return node
+
+    def number(self, value: float) -> NumberNode:
+        """
+        Return the shared constant node for value.
+        """
+        key = (type(value), value)
+        node = self._leaves.get(key)
+        if node is None:
+            node = self._leaves[key] = NumberNode(value).freeze()
+        return node
+
+    def bracket(self, bracket_type: str, indices: List[int]) -> BracketNode:
+        """
+        Return the shared bracket node. Indices are stored as a tuple.
+        """
+        indices = tuple(indices)
+        key = (bracket_type, indices)
+        node = self._leaves.get(key)
+        if node is None:
+            node = self._leaves[key] = BracketNode(bracket_type, indices).freeze()
+        return node
+
+    def operator(self, op_type: str, operands: List[ExpressionNode]) -> OperatorNode:
+        """
+        Return the shared operator node over already interned operands.
+        """
+        key = (op_type, tuple(map(id, operands)))
+        node = self._operators.get(key)
+        if node is None:
+            node = self._operators[key] = OperatorNode(op_type, operands).freeze()
+        return node
+
+    def intern(self, root: ExpressionNode) -> ExpressionNode:
+        """
+        Rebuild a tree from shared nodes, turning repeated subtrees into a DAG.
+        """
+        memo: Dict[int, ExpressionNode] = {}
+        for node in iter_unique(root):
+            if isinstance(node, OperatorNode):
+                shared = self.operator(node.op_type, [memo[id(operand)] for operand in node.operands])
+            elif isinstance(node, BracketNode):
+                shared = self.bracket(node.bracket_type, node.indices)
+            elif isinstance(node, TwistorNode):
+                shared = self.twistor(node.index)
+            elif isinstance(node, DualTwistorNode):
+                shared = self.dual_twistor(node.index)
+            elif isinstance(node, NumberNode):
+                shared = self.number(node.value)
+            elif isinstance(node, InfinityTwistorNode):
+                shared = self.infinity_twistor()
+            else:
+                raise ValueError(f"Cannot intern node {type(node).__name__}")
+            memo[id(node)] = shared
+        return memo[id(root)]
+
+def iter_unique(root: ExpressionNode) -> Iterator[ExpressionNode]:
+    """
+    Yield each distinct node object of a tree or DAG once, children first.
+
+    Passes that only need one visit per shared subtree can iterate over
+    this to run in DAG size rather than tree size.
+    """
+    seen = set()
+    stack = [(root, False)]
+    while stack:
+        node, ready = stack.pop()
+        if ready:
+            yield node
+            continue
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stack.append((node, True))
+        if isinstance(node, OperatorNode):
+            stack.extend((operand, False) for operand in reversed(node.operands))
+
+def sort_indices(indices: Iterable[int]) -> Tuple[Tuple[int, ...], int]:
+    """
+    Sort bracket indices, returning (sorted tuple, permutation sign).
+
+    Brackets are antisymmetric, so <2,1,3,4> = -<1,2,3,4>; the sign is 0
+    when an index repeats and the bracket vanishes.
+    """
+    indices = tuple(indices)
+    ordered = tuple(sorted(indices))
+    for i in range(1, len(ordered)):
+        if ordered[i] == ordered[i - 1]:
+            return ordered, 0
+    inversions = 0
+    for i in range(len(indices)):
+        for j in range(i + 1, len(indices)):
+            if indices[i] > indices[j]:
+                inversions += 1
+    return ordered, -1 if inversions % 2 else 1
+
+# Operators whose value is multiplied by the sign of every operand.
+_SIGN_MULTIPLICATIVE = ('mul', 'div', 'dot')
+
+def _apply_sign(node: ExpressionNode, sign: int) -> ExpressionNode:
+    """
+    node times sign, folding a negative sign into a constant or the leading
+    coefficient of a product where there is one.
+    """
+    if sign > 0:
+        return node
+    if isinstance(node, NumberNode):
+        return NumberNode(-node.value)
+    if isinstance(node, OperatorNode) and node.op_type == 'mul' and node.operands \
+            and isinstance(node.operands[0], NumberNode):
+        coefficient = -node.operands[0].value
+        rest = list(node.operands[1:])
+        if coefficient == 1 and rest:
+            return rest[0] if len(rest) == 1 else OperatorNode('mul', rest)
+        return OperatorNode('mul', [NumberNode(coefficient)] + rest)
+    return OperatorNode('mul', [NumberNode(-1), node])
+
+def _fold_sum_signs(op_type: str, results: List[Tuple[ExpressionNode, int]]
+                    ) -> Tuple[str, List[ExpressionNode], int]:
+    """
+    Rewrite a sum or difference of signed terms as (operator, operands,
+    sign): add of every term when all terms agree in sign, carrying the
+    common sign upwards, otherwise sub of the positive terms and the
+    negative terms.
+    """
+    if op_type == 'sub':
+        results = results[:1] + [(operand, -sign) for operand, sign in results[1:]]
+    positive = [operand for operand, sign in results if sign > 0]
+    negative = [operand for operand, sign in results if sign < 0]
+    if not negative:
+        return 'add', positive, 1
+    if not positive:
+        return 'add', negative, -1
+    return 'sub', [_sum(positive), _sum(negative)], 1
+
+def _sum(terms: List[ExpressionNode]) -> ExpressionNode:
+    """
+    A single term, or the add node of several.
+    """
+    return terms[0] if len(terms) == 1 else OperatorNode('add', terms)
+
+def canonicalize(root: ExpressionNode) -> ExpressionNode:
+    """
+    Equivalent tree with every bracket's indices sorted.
+
+    Brackets are antisymmetric, so <2,1,3,4> becomes <1,2,3,4> with sign -1
+    and a bracket with a repeated index becomes 0. Signs are carried upwards
+    in one linear pass: mul, div and dot multiply the signs of their
+    operands, pow keeps the sign of its base for an odd integer exponent and
+    drops it for an even one. Signs of add and sub operands are folded into
+    the sum by _fold_sum_signs, so <1,2,3,4> - <2,1,3,4> becomes
+    <1,2,3,4> + <1,2,3,4>. Wherever a sign cannot pass through (operands of
+    other operators, non-integer exponents, the root) it is folded into the
+    node by _apply_sign. Subtrees that need no change are reused rather than
+    copied.
+    """
+    done: Dict[int, Tuple[ExpressionNode, int]] = {}
+    for node in iter_unique(root):
+        if isinstance(node, BracketNode):
+            key, sign = sort_indices(node.indices)
+            if sign == 0:
+                done[id(node)] = (NumberNode(0), 1)
+            elif key == tuple(node.indices):
+                done[id(node)] = (node, 1)
+            else:
+                done[id(node)] = (BracketNode(node.bracket_type, type(node.indices)(key)), sign)
+            continue
+        if not isinstance(node, OperatorNode):
+            done[id(node)] = (node, 1)
+            continue
+        results = [done[id(operand)] for operand in node.operands]
+        sign = 1
+        op_type = node.op_type
+        if op_type in ('add', 'sub') and len(results) > 1:
+            op_type, operands, sign = _fold_sum_signs(op_type, results)
+        elif op_type in _SIGN_MULTIPLICATIVE:
+            operands = [operand for operand, _ in results]
+            for _, operand_sign in results:
+                sign *= operand_sign
+        elif node.op_type == 'pow' and len(results) == 2:
+            (base, base_sign), exponent = results
+            exponent = _apply_sign(*exponent)
+            value = exponent.value if isinstance(exponent, NumberNode) else None
+            if isinstance(value, (int, float)) and float(value).is_integer():
+                sign = base_sign if int(value) % 2 else 1
+            else:
+                base = _apply_sign(base, base_sign)
+            operands = [base, exponent]
+        else:
+            operands = [_apply_sign(operand, operand_sign) for operand, operand_sign in results]
+        if op_type == node.op_type and len(operands) == len(node.operands) \
+                and all(new is old for new, old in zip(operands, node.operands)):
+            done[id(node)] = (node, sign)
+        else:
+            rebuilt = OperatorNode(op_type, type(node.operands)(operands))
+            done[id(node)] = (rebuilt, sign)
+    return _apply_sign(*done[id(root)])
+
+# Binary operator symbol -> (operator name, precedence, right associative).
+_BINARY_OPERATORS = {
+    '+': ('add', 1, False),
+    '-': ('sub', 1, False),
+    '*': ('mul', 2, False),
+    '/': ('div', 2, False),
+    '.': ('dot', 2, False),
+    '^': ('pow', 4, True),
+}
+# Unary minus binds tighter than products but looser than powers.
+_NEGATE = ('neg', 3, True)
+_OPEN = ('(', 0, False)
+# Operators that are stored n-ary, so chains are flattened into one node.
+_ASSOCIATIVE = ('add', 'mul')
+_OPERATOR_NAMES = frozenset(OPERATORS)
+
+def _parse_number(text: str) -> Union[int, float]:
+    """
+    Read a number token, keeping integers exact.
+    """
+    if '.' in text or 'e' in text or 'E' in text:
+        return float(text)
+    return int(text)
+
+def _leaf_node(token: Token, interner: Optional[NodeInterner]) -> Optional[ExpressionNode]:
+    """
+    Build the node for an operand token, or None if token is not an operand.
+    """
+    if token.type == TokenType.BRACKET:
+        if interner is not None:
+            return interner.bracket(token.value, token.indices)
+        return BracketNode(token.value, token.indices)
+    if token.type == TokenType.NUMBER:
+        value = _parse_number(token.value)
+        return interner.number(value) if interner is not None else NumberNode(value)
+    if token.type == TokenType.TWISTOR:
+        index = token.indices[0]
+        return interner.twistor(index) if interner is not None else TwistorNode(index)
+    if token.type == TokenType.DUAL_TWISTOR:
+        index = token.indices[0]
+        return interner.dual_twistor(index) if interner is not None else DualTwistorNode(index)
+    if token.type == TokenType.INFINITY_TWISTOR:
+        return interner.infinity_twistor() if interner is not None else InfinityTwistorNode()
+    return None
+
+def _reduce(operator: tuple, operands: List[ExpressionNode]):
+    """
+    Pop the operands of operator and push the node it builds.
+
+    Nodes built here hold their operands in a deque, so a flattened sum or
+    product can grow at either end: the shorter operand list is merged into
+    the longer one, keeping left- and right-nested input linear.
+    _finish_operands turns the deques back into lists.
+    """
+    name = operator[0]
+    if name == 'neg':
+        operand = operands.pop()
+        if isinstance(operand, NumberNode):
+            operands.append(NumberNode(-operand.value))
+        else:
+            operands.append(OperatorNode('mul', deque([NumberNode(-1), operand])))
+        return
+    right = operands.pop()
+    left = operands.pop()
+    if name in _ASSOCIATIVE:
+        left_same = isinstance(left, OperatorNode) and left.op_type == name
+        right_same = isinstance(right, OperatorNode) and right.op_type == name
+        if left_same and (not right_same or len(left.operands) >= len(right.operands)):
+            if right_same:
+                left.operands.extend(right.operands)
+            else:
+                left.operands.append(right)
+            operands.append(left)
+        elif right_same:
+            if left_same:
+                right.operands.extendleft(reversed(left.operands))
+            else:
+                right.operands.appendleft(left)
+            operands.append(right)
+        else:
+            operands.append(OperatorNode(name, deque([left, right])))
+        return
+    operands.append(OperatorNode(name, deque([left, right])))
+
+def _finish_operands(root: ExpressionNode) -> ExpressionNode:
+    """
+    Convert the operand deques of freshly parsed nodes into lists.
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, OperatorNode) and isinstance(node.operands, deque):
+            _set_slot(node, 'operands', list(node.operands))
+            stack.extend(node.operands)
+    return root
+
+def parse_tokens(tokens: Iterable[Token], interner: Optional[NodeInterner] = None) -> ExpressionNode:
+    """
+    Build an expression tree from a token stream.
+
+    Uses iterative operator-precedence parsing (shunting-yard), so long flat
+    sums and deeply nested parentheses parse in linear time without
+    recursion. Sums and products are flattened into n-ary add/mul nodes,
+    juxtaposed operands are multiplied and unary minus becomes a -1 factor.
+    If an interner is given, leaves are shared through it.
+    """
+    operands: List[ExpressionNode] = []
+    operators: List[tuple] = []
+    expect_operand = True
+    for token in tokens:
+        node = _leaf_node(token, interner)
+        if node is not None or token.type == TokenType.BRACKET_OPEN:
+            if not expect_operand:
+                token_operator = _BINARY_OPERATORS['*']
+                while operators and operators[-1][1] >= token_operator[1]:
+                    _reduce(operators.pop(), operands)
+                operators.append(token_operator)
+            if node is None:
+                operators.append(_OPEN)
+                expect_operand = True
+            else:
+                operands.append(node)
+                expect_operand = False
+        elif token.type == TokenType.BRACKET_CLOSE:
+            if expect_operand:
+                raise ValueError(f"Unexpected token {token!r}")
+            while operators and operators[-1] is not _OPEN:
+                _reduce(operators.pop(), operands)
+            if not operators:
+                raise ValueError("Unbalanced parentheses")
+            operators.pop()
+        elif token.type in (TokenType.OPERATOR, TokenType.DOT):
+            if expect_operand:
+                if token.value == '-':
+                    operators.append(_NEGATE)
+                elif token.value != '+':
+                    raise ValueError(f"Unexpected token {token!r}")
+                continue
+            token_operator = _BINARY_OPERATORS[token.value]
+            precedence = token_operator[1]
+            while operators and (operators[-1][1] > precedence
+                                 or (operators[-1][1] == precedence and not token_operator[2])):
+                _reduce(operators.pop(), operands)
+            operators.append(token_operator)
+            expect_operand = True
+        else:
+            raise ValueError(f"Unexpected token {token!r}")
+    if expect_operand:
+        raise ValueError("Unexpected end of expression")
+    while operators:
+        operator = operators.pop()
+        if operator is _OPEN:
+            raise ValueError("Unbalanced parentheses")
+        _reduce(operator, operands)
+    return _finish_operands(operands[0])
+
+def parse(text: str, interner: Optional[NodeInterner] = None) -> ExpressionNode:
+    """
+    Parse an expression string such as "<1,2,3,4>*[2,3,4,5]/(<1,2,5,6>+...)".
+    """
+    return parse_tokens(iter_tokens(text), interner)
+
+def _parse_chunk(task: Tuple[List[str], bool]) -> Any:
+    """
+    Parse one chunk of strings in a worker process.
+    """
+    strings, flat = task
+    trees = [parse(text) for text in strings]
+    if flat:
+        from src.utils.flat import FlatExpression
+        return FlatExpression.from_trees(trees)
+    return trees
+
+def parse_many(strings: Iterable[str], workers: Optional[int] = None,
+               chunksize: int = 1000, flat: bool = False) -> Any:
+    """
+    Parse many expression strings, fanning chunks out over a process pool.
+
+    Results come back in input order: a list of trees, or with flat=True a
+    single FlatExpression holding every tree. Flat results are cheaper to
+    send between processes and do not hit pickle's recursion limit on very
+    deep trees. workers defaults to the number of CPUs; with one worker or
+    a single chunk everything is parsed in this process.
+    """
+    strings = list(strings)
+    chunks = [(strings[start:start + chunksize], flat)
+              for start in range(0, len(strings), chunksize)]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(chunks) <= 1:
+        results = [_parse_chunk(chunk) for chunk in chunks]
+    else:
+        with multiprocessing.Pool(min(workers, len(chunks))) as pool:
+            results = pool.map(_parse_chunk, chunks, chunksize=1)
+    if flat:
+        from src.utils.flat import FlatExpression
+        return FlatExpression.concatenate(results)
+    return [tree for chunk in results for tree in chunk]
+
+_PREFIX_BRACKET = re.compile(r"(angle|square)(\d*)")
+
+@lru_cache(maxsize=4096)
+def _prefix_leaf(token: str) -> tuple:
+    """
+    Describe the leaf written as token in prefix notation.
+    """
+    if not token:
+        raise ValueError("Empty prefix token")
+    if token == 'I':
+        return ('I',)
+    if token[0] in 'ZW' and token[1:].isdigit():
+        return (token[0], int(token[1:]))
+    match = _PREFIX_BRACKET.fullmatch(token)
+    if match:
+        return ('B', match.group(1), tuple(int(digit) for digit in match.group(2)))
+    try:
+        return ('N', _parse_number(token))
+    except ValueError:
+        raise ValueError(f"Unknown prefix token {token!r}") from None
+
+def _build_prefix_leaf(token: str, interner: Optional[NodeInterner]) -> ExpressionNode:
+    """
+    Build the node for a leaf token in prefix notation.
+    """
+    leaf = _prefix_leaf(token)
+    kind = leaf[0]
+    if interner is not None:
+        if kind == 'B':
+            return interner.bracket(leaf[1], leaf[2])
+        if kind == 'N':
+            return interner.number(leaf[1])
+        if kind == 'Z':
+            return interner.twistor(leaf[1])
+        if kind == 'W':
+            return interner.dual_twistor(leaf[1])
+        return interner.infinity_twistor()
+    if kind == 'B':
+        return BracketNode(leaf[1], list(leaf[2]))
+    if kind == 'N':
+        return NumberNode(leaf[1])
+    if kind == 'Z':
+        return TwistorNode(leaf[1])
+    if kind == 'W':
+        return DualTwistorNode(leaf[1])
+    return InfinityTwistorNode()
+
+def from_prefix_notation(tokens: Iterable[str], interner: Optional[NodeInterner] = None) -> ExpressionNode:
+    """
+    Rebuild an expression tree from prefix notation tokens.
+
+    Inverse of to_prefix_notation: operators are binary and left folds of
+    add/mul are collapsed back into n-ary nodes. Operator nodes with fewer
+    than two operands have no decodable prefix form. Bracket indices are
+    read one digit each, as written by to_prefix_notation for n < 10 points.
+    If an interner is given, leaves are shared through it.
+    """
+    pending: List[Tuple[str, List[ExpressionNode]]] = []
+    result = None
+    for token in tokens:
+        if token in _OPERATOR_NAMES:
+            pending.append((token, []))
+            continue
+        node = _build_prefix_leaf(token, interner)
+        while pending:
+            name, operands = pending[-1]
+            operands.append(node)
+            if len(operands) < 2:
+                break
+            pending.pop()
+            left = operands[0]
+            if name in _ASSOCIATIVE and isinstance(left, OperatorNode) and left.op_type == name:
+                left.operands.append(operands[1])
+                node = left
+            else:
+                node = OperatorNode(name, operands)
+        else:
+            if result is not None:
+                raise ValueError(f"Unexpected token {token!r} after complete expression")
+            result = node
+    if pending or result is None:
+        raise ValueError("Incomplete prefix expression")
+    return result
@@ -0,0 +1,240 @@
+"""
+Binary wire format for momentum twistor expression trees.
+Module writes trees as compact prefix-order records and reads them back
+directly from a memoryview without copying the input.
+
+Layout: the magic bytes, a varint tree count, then every node of every tree
+in prefix order. Each node starts with a tag byte holding its NodeKind in
+the low three bits:
+    OPERATOR         -- operator code in bits 3-7, then varint arity
+    TWISTOR, DUAL    -- varint index
+    INFINITY_TWISTOR -- nothing further
+    NUMBER           -- bit 3 set: little-endian float64; clear: zigzag varint
+    BRACKET          -- bracket type code in bits 3-5, varint count unless
+                        bit 7 marks the usual four indices, then the indices
+                        as nibbles (bit 6 set, all indices < 16) or varints
+"""
+import struct
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+from src.utils.parser import (
+    BRACKET_CODES,
+    BRACKET_TYPES,
+    OPERATOR_CODES,
+    OPERATORS,
+    BracketNode,
+    DualTwistorNode,
+    ExpressionNode,
+    InfinityTwistorNode,
+    NodeInterner,
+    NodeKind,
+    NumberNode,
+    OperatorNode,
+    TwistorNode,
+)
+
+MAGIC = b'MTW\x01'
+
+_FLOAT_FLAG = 0x08
+_PACKED_FLAG = 0x40
+_FOUR_FLAG = 0x80
+_DOUBLE = struct.Struct('<d')
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+def _write_varint(out: bytearray, value: int):
+    """
+    Append an unsigned LEB128 varint.
+    """
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(view: memoryview, pos: int) -> Tuple[int, int]:
+    """
+    Read an unsigned LEB128 varint, returning (value, next position).
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = view[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def _write_node(out: bytearray, node: ExpressionNode):
+    """
+    Append the record of a single node, excluding its operands.
+    """
+    if isinstance(node, OperatorNode):
+        if node.op_type not in OPERATOR_CODES:
+            raise ValueError(f"Cannot encode operator {node.op_type!r}")
+        out.append(NodeKind.OPERATOR | OPERATOR_CODES[node.op_type] << 3)
+        _write_varint(out, len(node.operands))
+    elif isinstance(node, BracketNode):
+        if node.bracket_type not in BRACKET_CODES:
+            raise ValueError(f"Cannot encode bracket {node.bracket_type!r}")
+        indices = node.indices
+        packed = all(0 <= index < 16 for index in indices)
+        four = len(indices) == 4
+        out.append(NodeKind.BRACKET | BRACKET_CODES[node.bracket_type] << 3
+                   | (_PACKED_FLAG if packed else 0) | (_FOUR_FLAG if four else 0))
+        if not four:
+            _write_varint(out, len(indices))
+        if packed:
+            for i in range(0, len(indices) - 1, 2):
+                out.append(indices[i] << 4 | indices[i + 1])
+            if len(indices) % 2:
+                out.append(indices[-1] << 4)
+        else:
+            for index in indices:
+                _write_varint(out, index)
+    elif isinstance(node, NumberNode):
+        if isinstance(node.value, int):
+            out.append(NodeKind.NUMBER)
+            value = node.value
+            _write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+        else:
+            out.append(NodeKind.NUMBER | _FLOAT_FLAG)
+            out += _DOUBLE.pack(node.value)
+    elif isinstance(node, TwistorNode):
+        out.append(NodeKind.TWISTOR)
+        _write_varint(out, node.index)
+    elif isinstance(node, DualTwistorNode):
+        out.append(NodeKind.DUAL_TWISTOR)
+        _write_varint(out, node.index)
+    elif isinstance(node, InfinityTwistorNode):
+        out.append(NodeKind.INFINITY_TWISTOR)
+    else:
+        raise ValueError(f"Cannot encode node {type(node).__name__}")
+
+def dumps_many(trees: Sequence[ExpressionNode]) -> bytes:
+    """
+    Encode a sequence of expression trees.
+    """
+    out = bytearray(MAGIC)
+    _write_varint(out, len(trees))
+    for root in trees:
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            _write_node(out, node)
+            if isinstance(node, OperatorNode):
+                stack.extend(reversed(node.operands))
+    return bytes(out)
+
+def dumps(node: ExpressionNode) -> bytes:
+    """
+    Encode a single expression tree.
+    """
+    return dumps_many([node])
+
+def _read_leaf(view: memoryview, pos: int, tag: int,
+               interner: Optional[NodeInterner]) -> Tuple[ExpressionNode, int]:
+    """
+    Decode the leaf whose tag byte has already been read.
+    """
+    kind = tag & 0x07
+    if kind == NodeKind.BRACKET:
+        if tag & _FOUR_FLAG:
+            count = 4
+        else:
+            count, pos = _read_varint(view, pos)
+        if tag & _PACKED_FLAG:
+            end = pos + (count + 1) // 2
+            if end > len(view):
+                raise IndexError(end)
+            indices = []
+            for byte in view[pos:end]:
+                indices.append(byte >> 4)
+                indices.append(byte & 0x0F)
+            del indices[count:]
+            pos = end
+        else:
+            indices = []
+            for _ in range(count):
+                index, pos = _read_varint(view, pos)
+                indices.append(index)
+        code = (tag >> 3) & 0x07
+        if code >= len(BRACKET_TYPES):
+            raise ValueError(f"Unknown bracket code {code}")
+        bracket_type = BRACKET_TYPES[code]
+        if interner is not None:
+            return interner.bracket(bracket_type, indices), pos
+        return BracketNode(bracket_type, indices), pos
+    if kind == NodeKind.NUMBER:
+        if tag & _FLOAT_FLAG:
+            value = _DOUBLE.unpack_from(view, pos)[0]
+            pos += _DOUBLE.size
+        else:
+            encoded, pos = _read_varint(view, pos)
+            value = encoded >> 1 if not encoded & 1 else -((encoded + 1) >> 1)
+        return (interner.number(value) if interner is not None else NumberNode(value)), pos
+    if kind == NodeKind.TWISTOR:
+        index, pos = _read_varint(view, pos)
+        return (interner.twistor(index) if interner is not None else TwistorNode(index)), pos
+    if kind == NodeKind.DUAL_TWISTOR:
+        index, pos = _read_varint(view, pos)
+        return (interner.dual_twistor(index) if interner is not None else DualTwistorNode(index)), pos
+    if kind == NodeKind.INFINITY_TWISTOR:
+        return (interner.infinity_twistor() if interner is not None else InfinityTwistorNode()), pos
+    raise ValueError(f"Unknown node tag {tag:#x}")
+
+def iter_loads(data: Buffer, interner: Optional[NodeInterner] = None) -> Iterator[ExpressionNode]:
+    """
+    Lazily decode the trees of an encoded buffer.
+
+    The buffer is read through a memoryview, so no copy of it is made. If an
+    interner is given, leaves are shared through it.
+    """
+    view = memoryview(data).cast('B')
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Not an expression wire buffer")
+    try:
+        count, pos = _read_varint(view, len(MAGIC))
+        for _ in range(count):
+            pending: List[Tuple[str, int, List[ExpressionNode]]] = []
+            while True:
+                tag = view[pos]
+                pos += 1
+                if tag & 0x07 == NodeKind.OPERATOR:
+                    code = tag >> 3
+                    if code >= len(OPERATORS):
+                        raise ValueError(f"Unknown operator code {code}")
+                    arity, pos = _read_varint(view, pos)
+                    if arity:
+                        pending.append((OPERATORS[code], arity, []))
+                        continue
+                    node = OperatorNode(OPERATORS[code], [])
+                else:
+                    node, pos = _read_leaf(view, pos, tag, interner)
+                while pending:
+                    name, arity, operands = pending[-1]
+                    operands.append(node)
+                    if len(operands) < arity:
+                        break
+                    pending.pop()
+                    node = OperatorNode(name, operands)
+                if not pending:
+                    break
+            yield node
+    except (IndexError, struct.error):
+        raise ValueError("Truncated expression wire buffer") from None
+
+def loads_many(data: Buffer, interner: Optional[NodeInterner] = None) -> List[ExpressionNode]:
+    """
+    Decode every tree of an encoded buffer.
+    """
+    return list(iter_loads(data, interner))
+
+def loads(data: Buffer, interner: Optional[NodeInterner] = None) -> ExpressionNode:
+    """
+    Decode a buffer holding a single tree.
+    """
+    trees = loads_many(data, interner)
+    if len(trees) != 1:
+        raise ValueError(f"Expected one tree, found {len(trees)}")
+    return trees[0]
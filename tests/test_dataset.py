@@ -0,0 +1,86 @@
+import pickle
+
+import numpy as np
+import torch
+
+from src.data.dataset import (
+    BOS,
+    EOS,
+    UNK,
+    CorpusWriter,
+    ExpressionCorpus,
+    ExpressionDataset,
+    Vocabulary,
+    write_corpus,
+)
+from src.utils.parser import parse
+
+
+def test_vocabulary_encodes_expressions():
+    vocab = Vocabulary.for_points(6)
+    expr = parse('<1,2,3,4> / <2,3,4,5> + 3 * Z_{1}')
+    ids = vocab.encode_expression(expr)
+    assert ids[0] == BOS and ids[-1] == EOS
+    assert vocab.decode(ids) == expr.to_prefix_notation()
+    assert vocab.encode(['angle1278']) == [UNK]
+
+
+def test_vocabulary_save_load(tmp_path):
+    vocab = Vocabulary.for_points(5)
+    vocab.save(tmp_path / 'vocab.json')
+    assert Vocabulary.load(tmp_path / 'vocab.json').tokens == vocab.tokens
+
+
+def test_corpus_round_trip(tmp_path):
+    sequences = [[1, 5, 6, 2], [], [1, 300, 2], list(range(1000))]
+    path = str(tmp_path / 'corpus.bin')
+    assert write_corpus(path, sequences) == 4
+    corpus = ExpressionCorpus(path)
+    assert len(corpus) == 4
+    assert [corpus[i].tolist() for i in range(4)] == sequences
+    assert corpus[-1].tolist() == sequences[-1]
+    assert corpus.lengths.tolist() == [4, 0, 3, 1000]
+    assert isinstance(corpus[0], np.memmap)
+    clone = pickle.loads(pickle.dumps(corpus))
+    assert clone[2].tolist() == sequences[2]
+
+
+def test_expression_dataset_pairs(tmp_path):
+    with CorpusWriter(str(tmp_path / 'src.bin'), np.int32) as writer:
+        writer.add([1, 70000, 2])
+        writer.add([1, 2])
+    write_corpus(str(tmp_path / 'tgt.bin'), [[1, 4, 2], [1, 5, 2]])
+    dataset = ExpressionDataset(str(tmp_path / 'src.bin'), str(tmp_path / 'tgt.bin'))
+    source, target = dataset[0]
+    assert source.dtype == torch.int64 and source.tolist() == [1, 70000, 2]
+    assert target.tolist() == [1, 4, 2]
+    loader = torch.utils.data.DataLoader(dataset, batch_size=None, num_workers=1)
+    assert [pair[1].tolist() for pair in loader] == [[1, 4, 2], [1, 5, 2]]
+
+
+def test_token_budget_batches_reduce_padding():
+    from src.data.dataset import TokenBudgetBatchSampler
+
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(1, 400, size=5000)
+    sampler = TokenBudgetBatchSampler(lengths, max_tokens=4096, seed=1)
+    batches = list(sampler)
+    assert len(batches) == len(sampler)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    padded = sum(len(batch) * lengths[batch].max() for batch in batches)
+    assert all(len(batch) * lengths[batch].max() <= 4096 for batch in batches)
+    assert padded < 1.1 * lengths.sum()
+    assert list(sampler) == batches
+    sampler.set_epoch(1)
+    assert list(sampler) != batches
+
+
+def test_pad_collate(tmp_path):
+    from src.data.dataset import PAD, pad_collate
+
+    write_corpus(str(tmp_path / 'src.bin'), [[1, 7, 2], [1, 2]])
+    dataset = ExpressionDataset(str(tmp_path / 'src.bin'), str(tmp_path / 'src.bin'))
+    sources, targets = pad_collate([dataset[0], dataset[1]])
+    assert sources.tolist() == [[1, 7, 2], [1, 2, PAD]]
+    assert dataset.lengths.tolist() == [3, 2]
+    assert pad_collate([torch.tensor([3]), torch.tensor([4, 5])]).tolist() == [[3, PAD], [4, 5]]
@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+
+from src.utils.evaluation import evaluate, four_brackets, two_brackets
+from src.utils.parser import NodeInterner, parse
+
+# Five-term Plucker relation contracted with <6,7,8>.
+SCHOUTEN = ('<2,3,4,5><1,6,7,8> - <1,3,4,5><2,6,7,8> + <1,2,4,5><3,6,7,8>'
+            ' - <1,2,3,5><4,6,7,8> + <1,2,3,4><5,6,7,8>')
+
+
+def random_twistors(points=64, n=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((points, n, 4))
+
+
+def test_four_brackets_match_determinants():
+    Z = random_twistors(points=5)
+    values = four_brackets(Z, [[1, 2, 3, 4], [2, 1, 3, 4], [8, 6, 4, 2]])
+    assert values.shape == (5, 3)
+    for point in range(5):
+        assert values[point, 0] == pytest.approx(np.linalg.det(Z[point, [0, 1, 2, 3]]))
+        assert values[point, 2] == pytest.approx(np.linalg.det(Z[point, [7, 5, 3, 1]]))
+    assert np.allclose(values[:, 0], -values[:, 1])
+    lam = Z[:, [0, 2], :2]
+    assert np.allclose(two_brackets(Z, [[1, 3]])[:, 0], np.linalg.det(lam))
+
+
+def test_evaluate_expression():
+    Z = random_twistors()
+    expr = parse('<1,2,3,4> * <2,3,4,5>^2 / (<1,2,5,6> - 3) + <1,2>')
+    a, b, c = (four_brackets(Z, indices)[:, 0] for indices in ([1, 2, 3, 4], [2, 3, 4, 5], [1, 2, 5, 6]))
+    expected = a * b ** 2 / (c - 3) + two_brackets(Z, [[1, 2]])[:, 0]
+    assert np.allclose(evaluate(expr, Z), expected)
+    assert np.allclose(evaluate(parse('2'), Z), 2)
+
+
+def test_evaluate_identity_vanishes():
+    Z = random_twistors(points=256)
+    assert np.allclose(evaluate(parse(SCHOUTEN), Z), 0, atol=1e-9)
+    dag = NodeInterner().intern(parse(f'({SCHOUTEN}) * ({SCHOUTEN}) + <1,2,3,4>'))
+    assert np.allclose(evaluate(dag, Z), four_brackets(Z, [1, 2, 3, 4])[:, 0])
+
+
+def test_evaluate_rejects_non_scalars():
+    with pytest.raises(ValueError):
+        evaluate(parse('Z_{1}'), random_twistors())
+    with pytest.raises(ValueError):
+        evaluate(parse('[1,2,3,4]'), random_twistors())
+
+
+def test_bracket_cache_shares_orderings():
+    from src.utils.evaluation import BracketCache
+
+    Z = random_twistors()
+    cache = BracketCache(Z)
+    value = cache.get([1, 2, 3, 4])
+    assert np.allclose(cache.get([2, 1, 3, 4]), -value)
+    assert np.allclose(cache.get([4, 3, 2, 1]), value)
+    assert np.allclose(cache.get([1, 1, 3, 4]), 0)
+    assert len(cache) == 1
+    expr = parse(' + '.join(f'<{a},{b},{c},{d}>' for a, b, c, d in
+                            [(1, 2, 3, 4), (2, 1, 3, 4), (3, 4, 1, 2), (5, 6, 7, 8), (8, 7, 6, 5)]))
+    assert np.allclose(evaluate(expr, Z, cache), value + four_brackets(Z, [5, 6, 7, 8])[:, 0] * 2)
+    assert len(cache) == 2
+
+
+def test_compiled_expression_eliminates_common_subexpressions():
+    from src.utils.evaluation import compile_expression
+
+    expr = parse('<1,2,3,4>*<2,3,4,5> + <2,3,4,5>*<1,2,3,4> - <2,1,3,4>*<2,3,4,5> + <1,1,2,3>')
+    program = compile_expression(expr)
+    assert program.keys == [(1, 2, 3, 4), (2, 3, 4, 5)]
+    assert [instruction[0] for instruction in program.instructions] == ['mul', 'add', 'neg', 'mul', 'sub', 'add']
+    Z = random_twistors(points=1000)
+    a, b = four_brackets(Z, [[1, 2, 3, 4], [2, 3, 4, 5]]).T
+    assert np.allclose(program(Z), 3 * a * b)
+    assert np.allclose(program(Z, chunk_size=64), 3 * a * b)
+
+
+def test_compiled_expression_on_large_sum():
+    from src.utils.evaluation import compile_expression
+
+    rng = np.random.default_rng(1)
+    numerators = [rng.permutation(8)[:4] + 1 for _ in range(2000)]
+    denominators = [rng.permutation(8)[:4] + 1 for _ in range(2000)]
+    expr = parse(' + '.join(f'<{",".join(map(str, num))}>/<{",".join(map(str, den))}>'
+                            for num, den in zip(numerators, denominators)))
+    Z = random_twistors(points=500, seed=2)
+    program = compile_expression(expr)
+    assert len(program.keys) <= 70
+    expected = (four_brackets(Z, numerators) / four_brackets(Z, denominators)).sum(axis=1)
+    assert np.allclose(program(Z), expected)
+
+
+def random_integer_twistors(points=32, n=8, seed=0):
+    return np.random.default_rng(seed).integers(-1000, 1000, size=(points, n, 4))
+
+
+def test_exact_primitives():
+    from src.utils.exact import PRIMES, bareiss_det, det4_mod, inverse_mod
+
+    Z = random_integer_twistors(points=20)
+    p = PRIMES[0]
+    exact = [bareiss_det(point[:4].tolist()) for point in Z]
+    assert exact == [round(np.linalg.det(point[:4].astype(float))) for point in Z]
+    assert det4_mod(Z[:, :4] % p, p).tolist() == [value % p for value in exact]
+    x = np.arange(1, 1000, dtype=np.int64)
+    assert np.all(x * inverse_mod(x, p) % p == 1)
+    assert bareiss_det([[0, 1], [1, 0]]) == -1
+
+
+def test_modular_and_exact_evaluation_agree():
+    from src.utils.evaluation import evaluate_exact, evaluate_modular
+    from src.utils.exact import PRIMES
+
+    expr = parse('<1,2,3,4>^2 / (<2,3,4,5> * <1,2>) - 0.5 * <3,4,5,6>^-1 + 7')
+    Z = random_integer_twistors()
+    residues, valid = evaluate_modular(expr, Z)
+    assert residues.shape == valid.shape == (len(PRIMES), len(Z))
+    assert valid.all()
+    exact = evaluate_exact(expr, Z)
+    for row, p in enumerate(PRIMES):
+        expected = [value.numerator * pow(value.denominator, -1, p) % p for value in exact]
+        assert residues[row].tolist() == expected
+    assert np.allclose([float(value) for value in exact], evaluate(expr, Z.astype(float)))
+
+
+def test_modular_identity_is_exactly_zero():
+    from src.utils.evaluation import evaluate_modular
+
+    residues, valid = evaluate_modular(parse(SCHOUTEN), random_integer_twistors(points=256))
+    assert valid.all() and not residues.any()
+
+
+def test_modular_flags_vanishing_denominators():
+    from src.utils.evaluation import evaluate_exact, evaluate_modular
+
+    Z = random_integer_twistors(points=4)
+    Z[0, 1] = Z[0, 0]
+    expr = parse('<1,2,3,4> / <1,2,5,6>')
+    _, valid = evaluate_modular(expr, Z)
+    assert not valid[:, 0].any() and valid[:, 1:].all()
+    assert evaluate_exact(expr, Z)[0] is None
+
+
+def test_probably_equal():
+    from src.utils.evaluation import probably_equal
+
+    assert probably_equal(parse(SCHOUTEN), parse('0'), seed=0)
+    assert probably_equal(parse('<2,1,3,4> / <1,2,3,5>'), parse('<1,2,3,4> / <2,1,3,5>'), seed=0)
+    lhs = parse('<1,2,3,4>/<1,2,5,6> + <2,3,4,5>/<1,2,5,6>')
+    assert probably_equal(lhs, parse('(<1,2,3,4> + <2,3,4,5>) / <1,2,5,6>'), seed=0)
+    assert not probably_equal(lhs, parse('(<1,2,3,4> - <2,3,4,5>) / <1,2,5,6>'), seed=0)
+    assert not probably_equal(parse('<1,2,3,4>'), parse('<1,2,3,4> + 1e-12'), seed=0)
@@ -0,0 +1,24 @@
+import pytest
+
+from src.utils.flat import FlatExpression
+from src.utils.parser import BracketNode, NumberNode, OperatorNode, TwistorNode, parse, parse_many
+from tests.test_parser import build_corpus, nested_sum
+
+
+def test_flat_expression_round_trip():
+    corpus = build_corpus(BracketNode, OperatorNode, 50) + [nested_sum(20000), TwistorNode(3)]
+    flat = FlatExpression.from_trees(corpus)
+    assert len(flat) == len(corpus)
+    assert flat.sizes[0] == 1 + 3 * len(corpus[0].operands)
+    for original, decoded in zip(corpus, flat.to_trees()):
+        assert decoded.to_prefix_notation() == original.to_prefix_notation()
+
+
+def test_flat_expression_keeps_large_integers_exact():
+    exprs = [parse('12345678901234567 * <1,2,3,4> + 2.5'), parse('-9223372036854775808 + 0.1')]
+    flat = FlatExpression.concatenate([FlatExpression.from_tree(expr) for expr in exprs])
+    assert flat.to_trees() == exprs
+    assert parse_many(['12345678901234567 * <1,2,3,4>'], workers=1, flat=True).to_trees() == [
+        parse('12345678901234567 * <1,2,3,4>')]
+    with pytest.raises(ValueError):
+        FlatExpression.from_tree(NumberNode(2 ** 63))
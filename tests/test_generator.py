@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from src.data.generator import random_twistors
+
+
+def test_random_twistors_kinds():
+    real = random_twistors(100, 6)
+    assert real.shape == (100, 6, 4) and real.dtype == np.float64
+    assert random_twistors(10, 6, kind='complex').dtype == np.complex128
+    integer = random_twistors(100, 6, kind='integer', low=-5, high=5)
+    assert integer.dtype == np.int64 and integer.min() >= -5 and integer.max() <= 5
+    modular = random_twistors(100, 6, kind='modular', prime=101)
+    assert modular.min() >= 0 and modular.max() < 101
+    with pytest.raises(ValueError):
+        random_twistors(1, 6, kind='quaternion')
+
+
+def test_random_twistors_batches_are_reproducible_and_independent():
+    first = random_twistors(50, 8, seed=3, batch=7)
+    assert np.array_equal(first, random_twistors(50, 8, seed=3, batch=7))
+    assert not np.array_equal(first, random_twistors(50, 8, seed=3, batch=8))
+    assert not np.array_equal(first, random_twistors(50, 8, seed=4, batch=7))
+
+
+def test_expression_generator_sizes():
+    from src.data.generator import ExpressionGenerator
+    from src.utils.parser import BracketNode, iter_unique
+
+    generator = ExpressionGenerator(n=7, terms=(2, 3), numerator_factors=(1, 2), denominator_factors=(1, 1))
+    expressions = generator.generate(200, np.random.default_rng(0))
+    assert len(expressions) == 200
+    for expr in expressions:
+        assert expr.op_type == 'add' and 2 <= len(expr.operands) <= 3
+        assert all(term.op_type == 'div' for term in expr.operands)
+        for node in iter_unique(expr):
+            if isinstance(node, BracketNode):
+                assert list(node.indices) == sorted(set(node.indices)) and max(node.indices) <= 7
+
+
+def test_generate_corpus_is_deterministic(tmp_path):
+    from src.data.dataset import ExpressionCorpus, Vocabulary
+    from src.data.generator import ExpressionGenerator, generate_corpus
+    from src.utils.parser import from_prefix_notation
+
+    generator = ExpressionGenerator(n=6)
+    serial = generate_corpus(str(tmp_path / 'serial'), 250, generator, shards=3, workers=1, seed=5, chunk_size=40)
+    parallel = generate_corpus(str(tmp_path / 'parallel'), 250, generator, shards=3, workers=3, seed=5, chunk_size=40)
+    vocabulary = Vocabulary.for_points(6, 5)
+    total = 0
+    for left, right in zip(serial, parallel):
+        left_corpus, right_corpus = ExpressionCorpus(left), ExpressionCorpus(right)
+        assert np.array_equal(left_corpus.offsets, right_corpus.offsets)
+        total += len(left_corpus)
+        for i in range(len(left_corpus)):
+            assert np.array_equal(left_corpus[i], right_corpus[i])
+            from_prefix_notation(vocabulary.decode(left_corpus[i].tolist()))
+    assert total == 250
+
+
+def test_expression_generator_edge_cases():
+    from src.data.generator import ExpressionGenerator
+    from src.utils.evaluation import compile_expression
+    from src.utils.parser import parse
+
+    generator = ExpressionGenerator(n=6, numerator_factors=(0, 1), max_coefficient=1)
+    for expr in generator.generate(100, np.random.default_rng(1)):
+        compile_expression(expr)
+        assert parse(expr.to_string()) == expr
+    with pytest.raises(ValueError):
+        ExpressionGenerator(n=10)
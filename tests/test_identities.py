@@ -0,0 +1,48 @@
+import numpy as np
+
+from src.utils.evaluation import probably_equal
+from src.utils.identities import (
+    IdentityIndex,
+    bracket_id,
+    bracket_keys,
+    plucker_relation,
+    plucker_relations,
+    relation_node,
+)
+from src.utils.parser import NumberNode
+
+
+def test_plucker_relation_terms():
+    relation = plucker_relation((1, 2, 3, 4, 5), (6, 7, 8))
+    assert len(relation) == 5
+    assert relation[0] == (1, (1, 2, 3, 4), (5, 6, 7, 8))
+    # <bcde><afgh> with f = a vanishes, leaving four terms.
+    assert len(plucker_relation((1, 2, 3, 4, 5), (1, 6, 7))) == 4
+
+
+def test_plucker_relations_vanish():
+    relations = plucker_relations(7)
+    assert len(relations) == len(set(relations)) == 210
+    assert plucker_relations(5) == ()
+    for relation in relations[::7]:
+        assert probably_equal(relation_node(relation), NumberNode(0), points=4, seed=0)
+
+
+def test_bracket_ids_are_dense_and_stable():
+    assert [bracket_id(key) for key in bracket_keys(8).tolist()] == list(range(70))
+    assert np.array_equal(bracket_keys(8)[:15], bracket_keys(6))
+
+
+def test_identity_index_lookup(tmp_path):
+    index = IdentityIndex.load(7, str(tmp_path))
+    assert isinstance(index.terms, np.memmap) and len(index) == 210
+    relations = plucker_relations(7)
+    for key in bracket_keys(7).tolist():
+        expected = [i for i, relation in enumerate(relations)
+                    if any(tuple(key) in (first, second) for _, first, second in relation)]
+        assert index.relations_containing(key).tolist() == expected
+    assert np.array_equal(index.relations_containing((2, 1, 3, 4)), index.relations_containing((1, 2, 3, 4)))
+    assert len(index.relations_containing((1, 1, 2, 3))) == 0
+    assert all(index.relation(i) == relations[i] for i in range(len(index)))
+    reloaded = IdentityIndex.load(7, str(tmp_path))
+    assert np.array_equal(reloaded.indptr, index.indptr)
@@ -0,0 +1,415 @@
+import random
+import time
+import tracemalloc
+
+from src.utils.parser import (
+    BracketNode,
+    NumberNode,
+    OperatorNode,
+    TokenType,
+    TwistorNode,
+    from_prefix_notation,
+    parse,
+    tokenize,
+)
+
+
+def nested_sum(depth):
+    node = BracketNode('angle', [1, 2, 3, 4])
+    for i in range(depth):
+        node = OperatorNode('add', [node, NumberNode(i)])
+    return node
+
+
+def test_prefix_notation_order():
+    expr = OperatorNode('div', [
+        OperatorNode('mul', [BracketNode('angle', [1, 2, 3, 4]), TwistorNode(3)]),
+        NumberNode(2),
+    ])
+    assert expr.to_prefix_notation() == ['div', 'mul', 'angle1234', 'Z3', '2']
+
+
+def test_prefix_notation_deep_tree():
+    tokens = nested_sum(100000).to_prefix_notation()
+    assert len(tokens) == 200001
+    assert tokens[:2] == ['add', 'add']
+    assert tokens[100000:100003] == ['angle1234', '0', '1']
+
+
+def test_iter_prefix_matches_list():
+    expr = nested_sum(50)
+    assert list(expr.iter_prefix()) == expr.to_prefix_notation()
+    assert list(TwistorNode(5).iter_prefix()) == ['Z5']
+
+
+def test_iter_prefix_is_lazy():
+    tokens = nested_sum(100000).iter_prefix()
+    assert next(tokens) == 'add'
+    assert sum(1 for _ in tokens) == 200000
+
+
+class _DictBracket:
+    def __init__(self, bracket_type, indices):
+        self.bracket_type = bracket_type
+        self.indices = indices
+
+
+class _DictOperator:
+    def __init__(self, op_type, operands):
+        self.op_type = op_type
+        self.operands = operands
+
+
+def build_corpus(bracket_cls, operator_cls, size, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        terms = [
+            operator_cls('div', [
+                bracket_cls('angle', rng.sample(range(1, 9), 4)),
+                bracket_cls('angle', rng.sample(range(1, 9), 4)),
+            ])
+            for _ in range(rng.randint(1, 4))
+        ]
+        corpus.append(operator_cls('add', terms))
+    return corpus
+
+
+def measure_bytes(build):
+    tracemalloc.start()
+    corpus = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, corpus
+
+
+def test_slotted_nodes_have_no_dict():
+    for node in (BracketNode('angle', [1, 2, 3, 4]), OperatorNode('add', []),
+                 TwistorNode(1), NumberNode(1)):
+        assert not hasattr(node, '__dict__')
+
+
+def test_slotted_nodes_memory_benchmark(record_property):
+    size = 2000
+    slotted, corpus = measure_bytes(lambda: build_corpus(BracketNode, OperatorNode, size))
+    plain, _ = measure_bytes(lambda: build_corpus(_DictBracket, _DictOperator, size))
+    nodes = sum(1 + 3 * len(expr.operands) for expr in corpus)
+    record_property('slotted_bytes_per_node', round(slotted / nodes, 1))
+    record_property('dict_bytes_per_node', round(plain / nodes, 1))
+    assert slotted < 0.9 * plain
+
+
+def test_interner_shares_leaves_and_subtrees():
+    from src.utils.parser import NodeInterner
+
+    interner = NodeInterner()
+    a = interner.bracket('angle', [1, 2, 3, 4])
+    assert a is interner.bracket('angle', (1, 2, 3, 4))
+    assert a is not interner.bracket('angle', [2, 1, 3, 4])
+    assert interner.twistor(3) is interner.twistor(3)
+    assert interner.twistor(3) is not interner.dual_twistor(3)
+    assert interner.number(1) is not interner.number(1.0)
+    ratio = interner.operator('div', [a, interner.bracket('angle', [1, 2, 5, 6])])
+    assert ratio is interner.operator('div', [a, interner.bracket('angle', [1, 2, 5, 6])])
+    assert ratio.to_prefix_notation() == ['div', 'angle1234', 'angle1256']
+    assert len(interner) == 8
+
+
+def test_structural_equality_and_hash():
+    left = build_corpus(BracketNode, OperatorNode, 20, seed=3)
+    right = build_corpus(BracketNode, OperatorNode, 20, seed=3)
+    assert left == right
+    assert list(map(hash, left)) == list(map(hash, right))
+    assert OperatorNode('add', [TwistorNode(1)]) != OperatorNode('mul', [TwistorNode(1)])
+    assert NumberNode(1) != NumberNode(1.0)
+    assert nested_sum(50000) == nested_sum(50000)
+    assert nested_sum(50000) != nested_sum(50001)
+
+
+def test_intern_builds_dag():
+    from src.utils.parser import NodeInterner, iter_unique
+
+    term = OperatorNode('div', [BracketNode('angle', [1, 2, 3, 4]), BracketNode('angle', [2, 3, 4, 5])])
+    expr = OperatorNode('add', [
+        OperatorNode('mul', [term, BracketNode('angle', [1, 2, 3, 4])]),
+        OperatorNode('div', [BracketNode('angle', [1, 2, 3, 4]), BracketNode('angle', [2, 3, 4, 5])]),
+    ])
+    dag = NodeInterner().intern(expr)
+    assert dag == expr
+    assert dag.operands[0].operands[0] is dag.operands[1]
+    assert len(list(iter_unique(dag))) == 5
+    assert len(list(iter_unique(expr))) == 9
+
+
+def test_tokenize_expression():
+    tokens = tokenize('<1,2,3,4>*[2,3,4,5]/(<1, 2, 5, 6> + 2.5 - Z_{1}.W3^I)')
+    assert [token.type for token in tokens] == [
+        TokenType.BRACKET, TokenType.OPERATOR, TokenType.BRACKET, TokenType.OPERATOR,
+        TokenType.BRACKET_OPEN, TokenType.BRACKET, TokenType.OPERATOR, TokenType.NUMBER,
+        TokenType.OPERATOR, TokenType.TWISTOR, TokenType.DOT, TokenType.DUAL_TWISTOR,
+        TokenType.OPERATOR, TokenType.INFINITY_TWISTOR, TokenType.BRACKET_CLOSE,
+    ]
+    assert tokens[2].value == 'square' and tokens[2].indices == [2, 3, 4, 5]
+    assert tokens[7].value == '2.5'
+    assert tokens[9].indices == [1]
+    assert tokenize('<1234>')[0].indices == [1, 2, 3, 4]
+
+
+def test_tokenize_rejects_unknown_characters():
+    import pytest
+
+    with pytest.raises(ValueError, match="position 4"):
+        tokenize('Z_1 $ Z_2')
+
+
+def test_tokenize_throughput_benchmark(record_property):
+    text = ' + '.join(expr.to_string() for expr in build_corpus(BracketNode, OperatorNode, 5000))
+    start = time.perf_counter()
+    tokens = tokenize(text)
+    elapsed = time.perf_counter() - start
+    megabytes = len(text) / 1e6
+    record_property('tokenize_megabytes', round(megabytes, 2))
+    record_property('tokenize_megabytes_per_second', round(megabytes / elapsed, 2))
+    assert sum(token.type == TokenType.BRACKET for token in tokens) == text.count('<')
+
+
+def test_parse_precedence():
+    expr = parse('<1,2,3,4>*[2,3,4,5]/(<1,2,5,6>+<2,3,4,5> - 2)')
+    assert expr.to_prefix_notation() == [
+        'div', 'mul', 'angle1234', 'square2345',
+        'sub', 'add', 'angle1256', 'angle2345', '2',
+    ]
+    assert parse('-<1,2,3,4>^2').to_prefix_notation() == ['mul', '-1', 'pow', 'angle1234', '2']
+    assert parse('2^3^4').to_prefix_notation() == ['pow', '2', 'pow', '3', '4']
+    assert parse('<1234><2345> Z_{1}').to_prefix_notation() == ['mul', 'mul', 'angle1234', 'angle2345', 'Z1']
+    assert parse('1.5 - -2').to_prefix_notation() == ['sub', '1.5', '-2']
+
+
+def test_parse_rejects_malformed_input():
+    import pytest
+
+    for text in ['<1,2,3,4> +', '(<1,2,3,4>', '<1,2,3,4>)', '* <1,2,3,4>', '']:
+        with pytest.raises(ValueError):
+            parse(text)
+
+
+def test_parse_scales_to_long_and_deep_input():
+    terms = 20000
+    flat = parse(' + '.join(f'<1,2,3,{i % 9}>/<2,3,4,5>' for i in range(terms)))
+    assert flat.op_type == 'add' and len(flat.operands) == terms
+    deep = parse('(' * terms + '<1,2,3,4>' + ' + 1)' * terms)
+    assert deep.op_type == 'add' and len(deep.operands) == terms + 1
+    right = parse(' + ('.join(f'<1,2,3,{i % 9}>' for i in range(terms)) + ')' * (terms - 1))
+    assert right.op_type == 'add' and len(right.operands) == terms
+    assert right.operands[:3] == [parse('<1,2,3,0>'), parse('<1,2,3,1>'), parse('<1,2,3,2>')]
+    product = parse(' * ('.join(f'Z{i % 9 + 1}' for i in range(terms)) + ')' * (terms - 1))
+    assert product.op_type == 'mul' and len(product.operands) == terms
+
+
+def test_parse_shares_leaves_through_interner():
+    from src.utils.parser import NodeInterner
+
+    expr = parse('<1,2,3,4>/<2,3,4,5> + <1,2,3,4>', NodeInterner())
+    assert expr.operands[0].operands[0] is expr.operands[1]
+
+
+def test_from_prefix_notation_round_trip():
+    corpus = build_corpus(BracketNode, OperatorNode, 200) + [
+        nested_sum(20000),
+        parse('-Z_{1}.W_{2} ^ I + 2.5 * <1,2,3,4><2,3,4,5>[3,4,5,6]'),
+    ]
+    for expr in corpus:
+        if len(expr.operands) > 1:
+            tokens = expr.to_prefix_notation()
+            assert from_prefix_notation(tokens).to_prefix_notation() == tokens
+    assert from_prefix_notation(['add', 'add', 'Z1', 'Z2', 'Z3']).operands == [
+        TwistorNode(1), TwistorNode(2), TwistorNode(3)]
+
+
+def test_from_prefix_notation_rejects_malformed_tokens():
+    import pytest
+
+    for tokens in (['add', 'Z1'], ['Z1', 'Z2'], [], ['add', 'Z1', 'foo'], [''], ['add', 'Z1', '']):
+        with pytest.raises(ValueError):
+            from_prefix_notation(tokens)
+
+
+def test_parse_many_preserves_order():
+    from src.utils.parser import parse_many
+
+    corpus = build_corpus(BracketNode, OperatorNode, 300, seed=7)
+    strings = [expr.to_string() for expr in corpus]
+    expected = [parse(text) for text in strings]
+    assert parse_many(strings, workers=2, chunksize=64) == expected
+    flat = parse_many(strings, workers=2, chunksize=64, flat=True)
+    assert len(flat) == len(strings)
+    assert flat.to_trees() == expected
+    assert parse_many([]) == []
+
+
+def test_to_string_minimal_parentheses():
+    assert parse('(<1,2,3,4> + <2,3,4,5>) * Z_{1}').to_string() == '(<1, 2, 3, 4> + <2, 3, 4, 5>) * Z_{1}'
+    assert parse('(<1,2,3,4> * <2,3,4,5>) + Z_{1}').to_string() == '<1, 2, 3, 4> * <2, 3, 4, 5> + Z_{1}'
+    assert parse('<1,2,3,4> / (<2,3,4,5> / 2)').to_string() == '<1, 2, 3, 4> / (<2, 3, 4, 5> / 2)'
+    assert parse('(2^3)^4').to_string() == '(2^3)^4'
+    assert parse('2^(3^4)').to_string() == '2^3^4'
+    assert parse('(-2)^2').to_string() == '(-2)^2'
+    assert OperatorNode('f', [OperatorNode('add', [TwistorNode(1), NumberNode(2)])]).to_string() == 'f(Z_{1} + 2)'
+
+
+def test_to_string_round_trips_through_parse():
+    for text in ['<1,2,3,4>*[2,3,4,5]/(<1,2,5,6>+<2,3,4,5> - 2)', '-Z_{1}.W_{2} ^ I',
+                 '<1234> - (<2345> - <3456>)', '<1234>^(-1) / (<2345> <3456>)']:
+        expr = parse(text)
+        assert parse(expr.to_string()) == expr
+    a, b, c = BracketNode('angle', [1, 2, 3, 4]), TwistorNode(2), NumberNode(3)
+    for expr in [OperatorNode('mul', [a, OperatorNode('div', [b, c])]),
+                 OperatorNode('add', [a, OperatorNode('sub', [b, c])]),
+                 OperatorNode('sub', [a, OperatorNode('add', [b, c])]),
+                 OperatorNode('div', [a, OperatorNode('mul', [b, c])])]:
+        assert parse(expr.to_string()) == expr
+        assert parse(expr.to_string()).to_prefix_notation() == expr.to_prefix_notation()
+    chain = OperatorNode('pow', [NumberNode(2), NumberNode(3), NumberNode(2)])
+    assert chain.to_string() == '(2^3)^2'
+    assert parse(chain.to_string()).to_prefix_notation() == chain.to_prefix_notation()
+
+
+def test_to_string_deep_tree():
+    text = nested_sum(100000).to_string()
+    assert text.startswith('<1, 2, 3, 4> + 0 + 1 + 2')
+    assert '(' not in text
+
+
+def test_frozen_nodes_reject_assignment():
+    import pytest
+
+    from src.utils.parser import NodeInterner
+
+    expr = parse('2 * <1,2,3,4> + Z1').freeze()
+    text = expr.to_string()
+    for node, name, value in [(expr, 'op_type', 'mul'), (expr.operands[0].operands[0], 'value', 5),
+                              (expr.operands[0].operands[1], 'bracket_type', 'square'),
+                              (expr.operands[1], 'index', 2)]:
+        with pytest.raises(AttributeError):
+            setattr(node, name, value)
+        with pytest.raises(AttributeError):
+            delattr(node, name)
+    assert expr.to_string() == text
+    interner = NodeInterner()
+    with pytest.raises(AttributeError):
+        interner.number(2).value = 5
+    assert interner.number(2).value == 2
+    mutable = parse('<1,2,3,4> + 1')
+    mutable.op_type = 'sub'
+    mutable.operands[0].indices = [2, 1, 3, 4]
+    assert mutable.to_string() == '<2, 1, 3, 4> - 1'
+
+
+def test_frozen_nodes_cache_serialization():
+    import pytest
+
+    expr = parse('<1,2,3,4>*[2,3,4,5]/(<1,2,5,6>+<2,3,4,5> - 2)')
+    tokens = expr.to_prefix_notation()
+    text = expr.to_string()
+    assert not expr.frozen
+    assert expr.freeze() is expr and expr.frozen
+    assert isinstance(expr.operands, tuple)
+    assert isinstance(expr.operands[0].operands[0].indices, tuple)
+    assert expr.to_string() is expr.to_string() == text
+    assert expr.to_prefix_notation() == tokens
+    assert expr.prefix_length() == len(tokens)
+    with pytest.raises(AttributeError):
+        expr.operands.append(TwistorNode(1))
+
+
+def test_frozen_subtrees_reuse_cache():
+    shared = parse('<1,2,3,4> / <2,3,4,5>').freeze()
+    shared.to_string()
+    shared.to_prefix_notation()
+    object.__setattr__(shared, '_string', 'CACHED')
+    object.__setattr__(shared, '_prefix', ('CACHED',))
+    expr = OperatorNode('add', [shared, TwistorNode(1)])
+    assert expr.to_string() == 'CACHED + Z_{1}'
+    assert expr.to_prefix_notation() == ['add', 'CACHED', 'Z1']
+
+
+def test_interned_nodes_are_frozen():
+    from src.utils.parser import NodeInterner
+
+    interner = NodeInterner()
+    ratio = interner.operator('div', [interner.bracket('angle', [1, 2, 3, 4]), interner.twistor(1)])
+    assert ratio.frozen and ratio.operands[0].frozen
+
+
+def test_sort_indices_sign():
+    from src.utils.parser import sort_indices
+
+    assert sort_indices([1, 2, 3, 4]) == ((1, 2, 3, 4), 1)
+    assert sort_indices([2, 1, 3, 4]) == ((1, 2, 3, 4), -1)
+    assert sort_indices([4, 3, 2, 1]) == ((1, 2, 3, 4), 1)
+    assert sort_indices([2, 3, 4, 1]) == ((1, 2, 3, 4), -1)
+    assert sort_indices([1, 2, 2, 4]) == ((1, 2, 2, 4), 0)
+
+
+def test_canonicalize_folds_signs():
+    from src.utils.parser import canonicalize
+
+    cases = {
+        "<2,1,3,4>": "-1 * <1, 2, 3, 4>",
+        "3 * <2,1,3,4> * <1,2,4,3>": "3 * <1, 2, 3, 4> * <1, 2, 3, 4>",
+        "2 * <2,1,3,4>": "-2 * <1, 2, 3, 4>",
+        "<2,1,3,4> / <1,3,2,4> + <1,1,2,3>": "<1, 2, 3, 4> / <1, 2, 3, 4> + 0",
+        "<2,1,3,4>^3": "-1 * <1, 2, 3, 4>^3",
+        "<2,1,3,4>^2": "<1, 2, 3, 4>^2",
+        "-<2,1,3,4>": "<1, 2, 3, 4>",
+        "<1,2,3,4> - <2,1,4,3> * <1,3,2,5>": "<1, 2, 3, 4> + <1, 2, 3, 4> * <1, 2, 3, 5>",
+        "<2,1,3,4> - <1,2,3,4>": "-1 * (<1, 2, 3, 4> + <1, 2, 3, 4>)",
+        "1 + <2,1,3,4> + <1,2,4,3>": "1 - (<1, 2, 3, 4> + <1, 2, 3, 4>)",
+    }
+    for text, expected in cases.items():
+        assert canonicalize(parse(text)).to_string() == expected
+    assert canonicalize(parse("<1,2,3,4> - <2,1,3,4>")) == canonicalize(parse("<1,2,3,4> + <1,2,3,4>"))
+
+
+def test_canonicalize_reuses_canonical_subtrees():
+    from src.utils.parser import canonicalize
+
+    expr = parse("<1,2,3,4> * <1,2,3,5> + <2,1,3,4>")
+    result = canonicalize(expr)
+    assert result.operands[0] is expr.operands[0]
+    assert canonicalize(result) is result
+
+
+def test_canonicalize_preserves_value(tmp_path):
+    import numpy as np
+
+    from src.data.generator import ExpressionGenerator
+    from src.data.scrambler import Scrambler
+    from src.utils.evaluation import probably_equal
+    from src.utils.parser import canonicalize, iter_unique
+
+    rng = np.random.default_rng(2)
+    scrambler = Scrambler(6, steps=(0, 1), antisymmetry=0.8, cache_dir=str(tmp_path))
+    for seed, expr in enumerate(scrambler.scramble_batch(ExpressionGenerator(n=6).generate(30, rng), rng)):
+        canonical = canonicalize(expr)
+        for node in iter_unique(canonical):
+            if isinstance(node, BracketNode):
+                assert list(node.indices) == sorted(node.indices)
+        assert probably_equal(canonical, expr, points=3, seed=seed)
+
+
+def test_pickled_nodes_rehash_under_another_hash_seed(tmp_path):
+    import os
+    import subprocess
+    import sys
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    path = tmp_path / 'node.pkl'
+    text = '<1,2,3,4> / <2,3,4,5> + Z1 + 2'
+    dump = ("import pickle, sys; from src.utils.parser import parse; e = parse(sys.argv[2]); hash(e); "
+            "pickle.dump(e, open(sys.argv[1], 'wb'))")
+    load = ("import pickle, sys; from src.utils.parser import parse; e = pickle.load(open(sys.argv[1], 'rb')); "
+            "fresh = parse(sys.argv[2]); assert e == fresh and e in {fresh}")
+    for seed, script in (('1', dump), ('2', load)):
+        subprocess.run([sys.executable, '-c', script, str(path), text], cwd=root, check=True,
+                       env=dict(os.environ, PYTHONHASHSEED=seed))
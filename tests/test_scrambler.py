@@ -0,0 +1,41 @@
+import numpy as np
+
+from src.data.generator import ExpressionGenerator
+from src.data.scrambler import Scrambler, cyclic_mapping, relabel
+from src.utils.evaluation import probably_equal
+from src.utils.parser import parse
+
+
+def test_expansions_match_relations(tmp_path):
+    scrambler = Scrambler(6, cache_dir=str(tmp_path))
+    pair = ((1, 2, 3, 4), (1, 2, 5, 6))
+    entries = scrambler.expansions(pair)
+    assert entries
+    for relation_id, position in entries:
+        coefficient, first, second = scrambler.relation(relation_id)[position]
+        assert abs(coefficient) == 1 and (first, second) == pair
+    assert scrambler.expansions(((1, 2, 3, 4), (1, 2, 3, 5))) == ()
+
+
+def test_relabel_cyclic():
+    node = parse("<1,2,3,4> / <3,4,5,6>")
+    assert relabel(node, cyclic_mapping(6, 2)).to_string() == "<3, 4, 5, 6> / <5, 6, 1, 2>"
+
+
+def test_scrambled_pairs_are_equivalent(tmp_path):
+    rng = np.random.default_rng(0)
+    simple = ExpressionGenerator(n=7).generate(60, rng)
+    scrambler = Scrambler(7, steps=(2, 3), antisymmetry=0.5, cache_dir=str(tmp_path))
+    pairs = scrambler.training_pairs(simple, rng)
+    assert sum(len(scrambled.to_prefix_notation()) > len(target.to_prefix_notation())
+               for scrambled, target in pairs) > 40
+    for seed, (scrambled, target) in enumerate(pairs):
+        assert probably_equal(scrambled, target, points=3, seed=seed)
+
+
+def test_scramble_is_reproducible(tmp_path):
+    node = parse("<1,2,3,4> * <1,2,5,6> + 2 * <1,3,4,5> * <2,3,5,6>")
+    scrambler = Scrambler(6, steps=(3, 3), cache_dir=str(tmp_path))
+    first = scrambler.scramble(node, np.random.default_rng(4))
+    assert first == scrambler.scramble(node, np.random.default_rng(4))
+    assert probably_equal(first, node, seed=1)
@@ -0,0 +1,32 @@
+import pytest
+
+from src.utils import wire
+from src.utils.parser import BracketNode, OperatorNode, parse
+from tests.test_parser import build_corpus, nested_sum
+
+
+def test_wire_format_round_trip():
+    corpus = build_corpus(BracketNode, OperatorNode, 200) + [
+        nested_sum(20000),
+        parse('-Z_{1}.W_{12} ^ I + 2.5 * <1,2,3,4><2,3,4,5>[3,4,5,16] - 300 / <1,2,3>'),
+        OperatorNode('add', []),
+    ]
+    data = wire.dumps_many(corpus)
+    assert wire.loads_many(memoryview(data)) == corpus
+    assert wire.loads(wire.dumps(corpus[0])) == corpus[0]
+    brackets = build_corpus(BracketNode, OperatorNode, 2000)
+    text_size = sum(len(' '.join(expr.to_prefix_notation())) for expr in brackets)
+    assert len(wire.dumps_many(brackets)) * 2.5 < text_size
+
+
+def test_wire_format_rejects_bad_input():
+    data = wire.dumps(parse('<1,2,3,4> / <2,3,4,5>'))
+    with pytest.raises(ValueError):
+        wire.loads(data[:-2])
+    with pytest.raises(ValueError):
+        wire.loads(b'nope' + data[4:])
+    # Root tag at byte 5, its arity at 6 and the first bracket's tag at 7.
+    with pytest.raises(ValueError, match="Unknown operator code 31"):
+        wire.loads(data[:5] + bytes([31 << 3]) + data[6:])
+    with pytest.raises(ValueError, match="Unknown bracket code 7"):
+        wire.loads(data[:7] + bytes([data[7] | 0x38]) + data[8:])